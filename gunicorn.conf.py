@@ -0,0 +1,33 @@
+"""Gunicorn settings, used by both `gunicorn main:app` and `python main.py`"""
+import os
+import signal
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import main
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = 1  # Recording state lives in this one process
+worker_class = 'gthread'
+threads = main.WEB_THREADS
+timeout = 300
+graceful_timeout = main.SHUTDOWN_GRACE_PERIOD
+preload_app = True  # main is already imported here for the settings above
+
+
+def post_worker_init(worker):
+    """Start the worker's background tasks and begin shutdown as soon as it is told to stop"""
+    main.start_worker_tasks()
+    
+    # Gunicorn owns the worker's signals; chain ours so open /events streams end and
+    # recordings stop while gunicorn drains requests, not after
+    def handle_term(sig, frame):
+        main.begin_shutdown()
+        worker.handle_exit(sig, frame)
+    signal.signal(signal.SIGTERM, handle_term)
+
+
+def worker_exit(server, worker):
+    """Finish stopping recordings before the worker process exits"""
+    main.wait_for_shutdown()
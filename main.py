@@ -7,30 +7,40 @@ Automatically monitors TikTok users and records their livestreams with 24/7 reli
 import os
 import time
 import json
+import orjson
 import logging
+from logging.handlers import RotatingFileHandler
 import requests
+from urllib3.util.retry import Retry
 import subprocess
 import threading
 import yt_dlp
 import re
-from datetime import datetime, timedelta
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify, flash
+from datetime import datetime
+from flask import Flask, render_template, request, redirect, url_for, session, flash, Response
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import Flow
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
+from googleapiclient.errors import HttpError
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.http import MediaIoBaseUpload
 import signal
+import atexit
 import sys
 from pathlib import Path
 import hashlib
 import secrets
-import psutil
 import random
 import urllib.parse
 import gc
+import queue
+import select
 import traceback
-from threading import Lock
+from threading import Lock, RLock
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+from collections import deque
 
 # Flask app configuration
 app = Flask(__name__)
@@ -40,19 +50,138 @@ app.secret_key = os.environ.get("SECRET_KEY", secrets.token_hex(32))
 SCOPES = ['https://www.googleapis.com/auth/drive.file']
 RECORDINGS_DIR = "recordings"
 USERNAMES_FILE = "usernames.txt"
+# OAuth tokens kept server-side, keyed from the session; outside the checkout so it is never committed
+CREDENTIALS_STORE_FILE = os.environ.get(
+    'CREDENTIALS_STORE_FILE',
+    os.path.join(os.path.expanduser('~'), '.config', 'tiktok-recorder', 'credentials_store.json')
+)
+UPLOAD_JOURNAL_FILE = "pending_uploads.jsonl"  # Queued uploads, replayed after a restart
 CHECK_INTERVAL = 45  # Increased to reduce API load
 RECORDING_QUALITY = "best[height<=480]/worst[height<=480]/best"
 MAX_RECORDING_DURATION = 4 * 3600  # 4 hours max per recording
+MAX_CONCURRENT_RECORDINGS = int(os.environ.get('MAX_RECORDINGS', '4'))
+UPLOAD_WORKERS = int(os.environ.get('UPLOAD_WORKERS', '2'))
+UPLOAD_QUEUE_SIZE = 16  # Finished recordings waiting for upload before completion handlers block
+DRIVE_CHUNK_SIZE = int(os.environ.get('DRIVE_CHUNK_MB', '32')) * 1024 * 1024  # Multiple of 256KB
+UPLOAD_READ_BUFFER = 1024 * 1024  # Read buffer for the upload file handle
+DRIVE_DIRECT_UPLOAD_MAX = 8 * 1024 * 1024  # Smaller files are uploaded in one request, not a resumable session
+UPLOAD_CHUNK_RETRIES = 5  # Per-chunk retries (with backoff) before restarting the whole upload
+UPLOAD_PROGRESS_EVERY = 10  # Log upload progress every N chunks
+DRIVE_HTTP_TIMEOUT = 120  # Socket timeout for Drive requests, so a dead connection cannot hang an upload
+DRIVE_DESCRIPTION_TEMPLATE = 'TikTok livestream recording of @{username} from {when:%Y-%m-%d %H:%M:%S}'
+DRIVE_FOLDER_QUERY = "name='{name}' and mimeType='application/vnd.google-apps.folder' and trashed=false"
+TRANSIENT_HTTP_STATUSES = frozenset({429, 500, 502, 503, 504})  # Drive errors that are retried
+LIVE_CHECK_WORKERS = 8  # Concurrent liveness checks (also throttles TikTok requests)
+YTDLP_TRANSIENT_RETRIES = 2  # Extra yt-dlp attempts after a transient (non-"offline") error
+LIVE_CHECK_TIMEOUT = 90  # Max seconds to wait on a single liveness check
+LIVE_CACHE_TTL = CHECK_INTERVAL - 20  # Reuse live results within a monitoring cycle
+API_STATUS_CACHE_TTL = 1.5  # Seconds to reuse a built /api/status response
+MIN_RECORDING_BYTES = 100000  # Recordings smaller than ~100KB are discarded
+BYTES_PER_MB = 1024 * 1024
+RECORDING_STALL_TIMEOUT = 30  # Seconds without ffmpeg progress before a recording is stopped
+PROGRESS_CHECK_INTERVAL = 1  # Supervisor poll interval where ffmpeg exits cannot be watched via pidfd
+PROGRESS_LOG_INTERVAL = 120  # Seconds between progress log lines for each recording
+FFMPEG_EXIT_TIMEOUT = 30  # Seconds ffmpeg gets to finalize after SIGINT before it is killed
+FFMPEG_PROGRESS_KEYS = frozenset({  # Bytes: ffmpeg's stderr is read undecoded
+    b'frame', b'fps', b'bitrate', b'total_size', b'out_time_us', b'out_time_ms', b'out_time',
+    b'dup_frames', b'drop_frames', b'speed', b'progress'
+})
+# FFmpeg command pieces, built once; start_recording splices in the UA header, URL and output path
+FFMPEG_INPUT_ARGS = (
+    'ffmpeg',
+    '-nostdin',
+    '-nostats',
+    '-progress', 'pipe:2',         # Machine-readable key=value progress on stderr
+    '-loglevel', 'warning',
+)
+FFMPEG_PROTOCOL_ARGS = (
+    '-headers', 'Referer: https://www.tiktok.com/',
+    # Input/protocol options must precede -i to apply to the stream
+    '-reconnect', '1',
+    '-reconnect_streamed', '1',
+    '-reconnect_delay_max', '15',
+    '-rw_timeout', '20000000',     # 20 second timeout
+    '-analyzeduration', '10000000', # 10 seconds analysis
+    '-probesize', '10000000',      # 10MB probe size
+    '-thread_queue_size', '512',   # Larger thread queue
+)
+# HLS: keep-alive segment fetches, with the next segment requested in parallel
+FFMPEG_HLS_ARGS = ('-http_persistent', '1', '-http_multiple', '1')
+FFMPEG_COPY_ARGS = ('-c', 'copy', '-bsf:a', 'aac_adtstoasc')
+FFMPEG_TRANSCODE_ARGS = (
+    '-c:v', 'libx264',
+    '-c:a', 'aac',
+    '-preset', 'medium',           # Better quality
+    '-crf', '26',                  # Better quality for 480p
+    '-maxrate', '1500k',           # Increased bitrate
+    '-bufsize', '3000k',           # Larger buffer
+    '-vf', 'scale=-2:480:flags=lanczos',  # Better scaling
+)
+FFMPEG_OUTPUT_ARGS = (
+    '-movflags', '+faststart+frag_keyframe+empty_moov',  # Better streaming compatibility
+    '-f', 'mp4',                   # Ensure MP4 format
+    '-avoid_negative_ts', 'make_zero',  # Fix timestamp issues
+    '-fflags', '+genpts',          # Generate presentation timestamps
+    '-y',                          # Overwrite output file
+)
+FFPROBE_TIMEOUT = 5  # Seconds to wait for ffprobe when yt-dlp did not report codec/height
+PART_SUFFIX = '.part'  # ffmpeg writes here; renamed to the final name once the recording is kept
+STALE_PART_AGE = RECORDING_STALL_TIMEOUT * 2  # Unmodified this long, a .part file has no ffmpeg writing it
+LIVE_RECHECK_INTERVAL = 15  # Seconds before re-checking a user who was just seen live
+MAX_OFFLINE_BACKOFF = 300  # Cap on the per-user check interval for users who stay offline
+RECENT_LIVE_WINDOW = 600  # Users live within this many seconds keep the short recheck interval
+MIN_CYCLE_SLEEP = 10  # Shortest pause between monitoring cycles
+GC_INTERVAL = 600  # Seconds between full garbage collections in the monitoring loop
+TOKEN_REFRESH_INTERVAL = 45 * 60  # Refresh the Drive access token before its 1h expiry
+RECORDING_STOP_TIMEOUT = 20  # Seconds stop_recording waits for ffmpeg before killing it
+SSE_MAX_LIFETIME = 120  # Seconds before an /events response ends; EventSource reconnects by itself
+WEB_THREADS = int(os.environ.get('WEB_THREADS', '16'))  # Gunicorn request threads
+MAX_SSE_CLIENTS = max(1, WEB_THREADS - 4)  # Leave threads free for /health and page loads
+RECORDING_FINISH_TIMEOUT = 10  # Seconds shutdown waits for stopped recordings to be renamed and queued
+# Gunicorn graceful_timeout: parallel stops, then finishing, plus slack for SIGKILL waits and request draining
+SHUTDOWN_GRACE_PERIOD = RECORDING_STOP_TIMEOUT + RECORDING_FINISH_TIMEOUT + 10
+
+# Long-running process: collect the young generation less often
+gc.set_threshold(700 * 4, 10, 10)
+
+def collect_garbage():
+    """Run a full collection only if objects reached the oldest generation since the last one"""
+    # get_count()[2] counts gen1 collections since the last gen2 run; zero means nothing new to scan
+    if gc.get_count()[2] == 0:
+        return 0
+    return gc.collect()
 
 # Global state with thread safety
 monitoring_active = False
+monitoring_stop = threading.Event()  # Set to wake the monitoring loop's waits when monitoring stops
+shutdown_event = threading.Event()  # Set once the process is shutting down
+cleanup_wake = threading.Event()  # Set to run periodic_cleanup before its interval elapses
 monitoring_thread = None
 recording_processes = {}
 live_status = {}
 last_check_times = {}
+last_check_formatted = {}  # Display strings written alongside last_check_times
 drive_service = None
-active_recordings_lock = Lock()
+oauth_client_config = None
+active_recordings_lock = RLock()  # Re-entrant: cleanup/stop are called while held
 service_lock = Lock()
+credentials_store_lock = Lock()
+drive_creds = None  # Credentials backing drive_service, refreshed in the background
+drive_local = threading.local()  # Per-thread Drive service: httplib2 connections are not thread-safe
+creds_lock = Lock()
+creds_refresh_timer = None
+api_status_cache = {'expires': 0, 'body': b''}
+api_status_cache_lock = Lock()
+
+# Per-user live state machine
+STATE_OFFLINE = 'OFFLINE'
+STATE_LIVE = 'LIVE'
+STATE_RECORDING = 'RECORDING'
+STATE_ERROR_BACKOFF = 'ERROR_BACKOFF'
+user_state = {}
+next_check = {}  # username -> monotonic time the next liveness check is due
+consecutive_offline = {}  # username -> offline results since the user was last live
+last_seen_live = {}  # username -> monotonic time of the most recent live result
 
 # Session management
 session_start_time = datetime.now()
@@ -60,59 +189,202 @@ last_service_refresh = datetime.now()
 error_count = 0
 MAX_ERRORS_BEFORE_RESET = 10
 
-# Setup enhanced logging
-class RotatingHandler(logging.Handler):
-    def __init__(self, max_size=10*1024*1024):  # 10MB max
-        super().__init__()
-        self.max_size = max_size
-        
-    def emit(self, record):
-        try:
-            if os.path.exists('app.log') and os.path.getsize('app.log') > self.max_size:
-                # Rotate log file
-                if os.path.exists('app.log.old'):
-                    os.remove('app.log.old')
-                os.rename('app.log', 'app.log.old')
-        except:
-            pass
-
+# Setup enhanced logging (app.log rotates to app.log.1 at 10MB)
 logging.basicConfig(
-    level=logging.INFO,
+    level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
     format='%(asctime)s - %(levelname)s - %(message)s',
     handlers=[
-        logging.FileHandler('app.log'),
-        logging.StreamHandler(),
-        RotatingHandler()
+        RotatingFileHandler('app.log', maxBytes=10*1024*1024, backupCount=1),
+        logging.StreamHandler()
     ]
 )
 logger = logging.getLogger(__name__)
 
+# Thread pools are created once per process and reused until shutdown
+executor_pools = {}
+executor_pools_lock = Lock()
+
+def get_pool(name, max_workers):
+    """Return the named ThreadPoolExecutor, creating it once per process"""
+    # Keyed by PID so forked workers (e.g. gunicorn --preload) build their own threads
+    key = (name, os.getpid())
+    with executor_pools_lock:
+        pool = executor_pools.get(key)
+        if pool is None:
+            pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+            executor_pools[key] = pool
+        return pool
+
+def shutdown_pools():
+    """Stop accepting work on every pool and drop queued jobs"""
+    with executor_pools_lock:
+        pools = list(executor_pools.values())
+        executor_pools.clear()
+    
+    for pool in pools:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+atexit.register(shutdown_pools)
+
+class HashingReader:
+    """File wrapper that MD5-hashes each byte the first time it is read, tolerating re-reads after seeks"""
+    
+    def __init__(self, fh):
+        self._fh = fh
+        self.md5 = hashlib.md5()
+        self.hashed_bytes = 0  # Length of the prefix already fed to the hash
+    
+    def seek(self, *args):
+        return self._fh.seek(*args)
+    
+    def tell(self):
+        return self._fh.tell()
+    
+    def read(self, size=-1):
+        start = self._fh.tell()
+        data = self._fh.read(size)
+        # Only extend the hashed prefix; retried chunks re-read bytes already counted
+        if start <= self.hashed_bytes < start + len(data):
+            self.md5.update(memoryview(data)[self.hashed_bytes - start:])
+            self.hashed_bytes = start + len(data)
+        return data
+
+class StatusBroadcaster:
+    """Push per-user status deltas to dashboard clients over Server-Sent Events"""
+    
+    def __init__(self, backlog=256, keepalive=25, max_lifetime=SSE_MAX_LIFETIME, max_clients=MAX_SSE_CLIENTS):
+        self.condition = threading.Condition()
+        self.events = deque(maxlen=backlog)
+        self.version = 0
+        self.keepalive = keepalive
+        self.max_lifetime = max_lifetime
+        self.clients = threading.BoundedSemaphore(max_clients)  # Each open stream holds a server thread
+        self.closed = False
+    
+    def publish(self, event_type, data):
+        """Queue an event and wake every connected client"""
+        with self.condition:
+            self.version += 1
+            self.events.append((self.version, event_type, data))
+            self.condition.notify_all()
+    
+    def close(self):
+        """End every open stream, e.g. so the server can drain on shutdown"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+    
+    def stream(self, last_event_id=None):
+        """Yield SSE messages for one client as state changes, for at most max_lifetime seconds"""
+        deadline = time.monotonic() + self.max_lifetime
+        with self.condition:
+            last_seen = self.version
+            # A reconnecting client resumes from its last event while the backlog still covers it
+            if last_event_id is not None and self.events and self.events[0][0] <= last_event_id + 1:
+                last_seen = min(last_event_id, self.version)
+        
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            with self.condition:
+                self.condition.wait_for(lambda: self.closed or self.version > last_seen,
+                                        timeout=min(self.keepalive, remaining))
+                if self.closed:
+                    return
+                pending = [event for event in self.events if event[0] > last_seen]
+                last_seen = self.version
+            
+            if not pending:
+                yield ": keepalive\n\n"
+                continue
+            
+            for version, event_type, data in pending:
+                yield f"id: {version}\nevent: {event_type}\ndata: {json.dumps(data)}\n\n"
+
+status_broadcaster = StatusBroadcaster()
+
+def publish_user_updates(usernames):
+    """Broadcast the current status of a batch of users as one event"""
+    if not usernames:
+        return
+    
+    status_broadcaster.publish('users_update', [{
+        'username': username,
+        'is_live': live_status.get(username, False),
+        'is_recording': username in recording_processes,
+        'last_check': last_check_formatted.get(username)
+    } for username in usernames])
+
+def file_size(path):
+    """Size of a file from a single stat() call, or None if it does not exist"""
+    try:
+        return os.stat(path).st_size
+    except (TypeError, FileNotFoundError):
+        return None
+
+def drive_query_literal(value):
+    """Escape a value for use inside a single-quoted Drive query string"""
+    return value.replace('\\', '\\\\').replace("'", "\\'")
+
+def is_transient_drive_error(error):
+    """True for Drive failures worth retrying: rate limits, 5xx and network errors"""
+    if isinstance(error, HttpError):
+        status = error.resp.status
+        if status == 403:
+            # Drive reports per-user quota throttling as 403 rather than 429
+            content = error.content or b''
+            return b'rateLimitExceeded' in content or b'userRateLimitExceeded' in content
+        return status in TRANSIENT_HTTP_STATUSES
+    return isinstance(error, (OSError, httplib2.HttpLib2Error))
+
+def backoff_sleep(attempt, cap=30):
+    """Exponential backoff with jitter: ~1s, 2s, 4s ... capped"""
+    time.sleep(min(cap, 2 ** attempt + random.random()))
+
+def create_http_session(pool_size=LIVE_CHECK_WORKERS * 4):
+    """Create a keep-alive session whose connection pool is shared across check workers"""
+    http_session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=Retry(total=2, backoff_factor=0.3)
+    )
+    http_session.mount('https://', adapter)
+    http_session.mount('http://', adapter)
+    return http_session
+
+# Room status embedded in the /live page state: 2 means live, anything else (4 = ended) is offline
+LIVE_ROOM_STATUS_RE = re.compile(rb'"liveRoom(?:Info)?"\s*:\s*\{[^{}]*?"status"\s*:\s*(\d+)')
+# An empty roomId means the user has no live room at all
+LIVE_ROOM_ID_RE = re.compile(rb'"roomId"\s*:\s*"(\d*)"')
+# yt-dlp errors that simply mean "no stream right now"
+YTDLP_OFFLINE_ERROR_RE = re.compile(r'not currently live|private|unavailable|removed', re.I)
+LIVE_PROBE_TIMEOUT = 8
+YDL_CHECK_OPTS = {
+    'quiet': True,
+    'no_warnings': True,
+    'skip_download': True,
+    'socket_timeout': 10,  # Bound slow checks so a stuck user can't hold a pool worker
+    'retries': 2,
+    'fragment_retries': 2,
+    'extractor_retries': 2
+}
+
 class TikTokLiveDetector:
     """Enhanced TikTok live detection with better reliability and error recovery"""
     
-    def __init__(self):
-        self.session = requests.Session()
-        self.session.timeout = 15
+    def __init__(self, session=None):
+        self.session = session or create_http_session()
         self.user_agents = [
             'Mozilla/5.0 (iPhone; CPU iPhone OS 16_6 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.6 Mobile/15E148 Safari/604.1',
             'Mozilla/5.0 (Android 12; Mobile; rv:68.0) Gecko/68.0 Firefox/102.0',
             'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/118.0.0.0 Safari/537.36'
         ]
-        self.last_user_agent_rotation = datetime.now()
+        self.last_user_agent_rotation = time.monotonic()
         self.current_ua_index = 0
-    
-    def rotate_user_agent(self):
-        """Rotate user agent every 5 minutes"""
-        if datetime.now() - self.last_user_agent_rotation > timedelta(minutes=5):
-            self.current_ua_index = (self.current_ua_index + 1) % len(self.user_agents)
-            self.last_user_agent_rotation = datetime.now()
-    
-    def get_headers(self, mobile=True):
-        """Get current headers with rotation"""
-        self.rotate_user_agent()
-        ua = self.user_agents[self.current_ua_index]
-        
-        return {
+        # Headers only differ by user agent, so build one dict per UA slot up front
+        self._header_cache = tuple({
             'User-Agent': ua,
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
             'Accept-Language': 'en-US,en;q=0.5',
@@ -120,62 +392,119 @@ class TikTokLiveDetector:
             'Connection': 'keep-alive',
             'Cache-Control': 'no-cache',
             'Pragma': 'no-cache'
-        }
+        } for ua in self.user_agents)
+        self.ffmpeg_ua_header = f'User-Agent: {self.user_agents[0]}'  # Passed to ffmpeg/ffprobe -headers
+        self._ydl_local = threading.local()  # One YoutubeDL per checking thread
+        self._ydl_instances = []
+        self._ydl_instances_lock = Lock()
+        atexit.register(self.close)
+    
+    def _get_ydl(self):
+        """Return this thread's YoutubeDL, building it once (instances are not thread-safe)"""
+        ydl = getattr(self._ydl_local, 'ydl', None)
+        if ydl is None:
+            ydl = yt_dlp.YoutubeDL(YDL_CHECK_OPTS)
+            self._ydl_local.ydl = ydl
+            with self._ydl_instances_lock:
+                self._ydl_instances.append(ydl)
+        return ydl
     
-    def check_live_with_ytdlp(self, username):
-        """Enhanced yt-dlp check with better error handling"""
+    def close(self):
+        """Close every cached YoutubeDL instance"""
+        with self._ydl_instances_lock:
+            instances, self._ydl_instances = self._ydl_instances, []
+        for ydl in instances:
+            try:
+                ydl.close()
+            except Exception:
+                pass
+    
+    def rotate_user_agent(self):
+        """Rotate user agent every 5 minutes"""
+        now = time.monotonic()
+        if now - self.last_user_agent_rotation > 300:
+            self.current_ua_index = (self.current_ua_index + 1) % len(self.user_agents)
+            self.last_user_agent_rotation = now
+    
+    def get_headers(self, mobile=True):
+        """Get current headers with rotation (shared dict: callers must copy before mutating)"""
+        self.rotate_user_agent()
+        return self._header_cache[self.current_ua_index]
+    
+    def probe_live_page(self, username):
+        """Cheap single-GET liveness probe: True/False, or None when the page is ambiguous"""
+        try:
+            clean_username = username.replace('@', '').strip()
+            response = self.session.get(
+                f"https://www.tiktok.com/@{clean_username}/live",
+                headers=self.get_headers(mobile=True),
+                timeout=LIVE_PROBE_TIMEOUT,
+                allow_redirects=True
+            )
+            if response.status_code != 200:
+                return None
+            
+            body = response.content
+            match = LIVE_ROOM_STATUS_RE.search(body)
+            if match:
+                return match.group(1) == b'2'
+            
+            room = LIVE_ROOM_ID_RE.search(body)
+            if room and not room.group(1):
+                return False
+            return None
+            
+        except requests.RequestException as e:
+            logger.debug("🔍 Live page probe failed for %s: %s", username, e)
+            return None
+    
+    def check_live_with_ytdlp(self, username, process=False):
+        """yt-dlp check returning (is_live, stream_info, transient_error)"""
         try:
             clean_username = username.replace('@', '').strip()
             live_url = f"https://www.tiktok.com/@{clean_username}/live"
             
-            ydl_opts = {
-                'quiet': True,
-                'no_warnings': True,
-                'skip_download': True,
-                'timeout': 20,
-                'socket_timeout': 15,
-                'http_headers': self.get_headers(mobile=True),
-                'retries': 2,
-                'fragment_retries': 2,
-                'extractor_retries': 2
-            }
+            # Reuse this thread's extractor; only the rotating headers change per call
+            ydl = self._get_ydl()
+            ydl.params['http_headers'].update(self.get_headers(mobile=True))
             
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                try:
-                    info = ydl.extract_info(live_url, download=False)
-                    if info and (info.get('url') or info.get('formats')):
-                        # Validate that we actually have a playable stream
-                        if self._validate_stream_info(info):
-                            logger.info(f"✅ yt-dlp: {username} is LIVE with valid stream!")
-                            return True, info
-                        else:
-                            logger.warning(f"⚠️ yt-dlp: {username} detected but no valid stream")
-                            return False, None
-                            
-                except yt_dlp.utils.DownloadError as e:
-                    error_msg = str(e).lower()
-                    if any(phrase in error_msg for phrase in ["not currently live", "private", "unavailable", "removed"]):
-                        return False, None
-                    elif "geo" in error_msg or "region" in error_msg:
-                        logger.warning(f"⚠️ Geo-blocked for {username}")
-                        return False, None
+            try:
+                # process=False returns the raw extractor result, skipping format resolution
+                info = ydl.extract_info(live_url, download=False, process=process)
+                if info and (info.get('url') or info.get('formats') or info.get('is_live')):
+                    # Validate that we actually have a playable stream
+                    if self._validate_stream_info(info):
+                        logger.info("✅ yt-dlp: %s is LIVE with valid stream!", username)
+                        return True, info, False
                     else:
-                        logger.error(f"❌ yt-dlp error for {username}: {e}")
-                        return False, None
+                        logger.warning("⚠️ yt-dlp: %s detected but no valid stream", username)
+                        return False, None, False
+                        
+            except yt_dlp.utils.DownloadError as e:
+                error_msg = str(e).lower()
+                if YTDLP_OFFLINE_ERROR_RE.search(error_msg):
+                    return False, None, False
+                elif "geo" in error_msg or "region" in error_msg:
+                    logger.warning("⚠️ Geo-blocked for %s", username)
+                    return False, None, False
+                else:
+                    # Timeouts, HTTP 5xx, extractor hiccups: worth another try
+                    logger.error("❌ yt-dlp error for %s: %s", username, e)
+                    return False, None, True
             
-            return False, None
+            return False, None, False
             
         except Exception as e:
-            logger.error(f"❌ yt-dlp check failed for {username}: {e}")
-            return False, None
+            logger.error("❌ yt-dlp check failed for %s: %s", username, e)
+            return False, None, True
     
     def _validate_stream_info(self, info):
         """Validate that stream info contains usable data"""
         if not info:
             return False
             
-        # Check for direct URL
-        if info.get('url'):
+        # Check for direct URL (or an unresolved result that still reports a live stream)
+        if info.get('url') or info.get('is_live') or info.get('_type') == 'url':
             return True
             
         # Check formats
@@ -184,43 +513,245 @@ class TikTokLiveDetector:
             return False
             
         # Look for valid formats with URLs
-        valid_formats = [f for f in formats if f.get('url') and f.get('protocol') != 'unknown']
-        return len(valid_formats) > 0
+        return any(f.get('url') and f.get('protocol') != 'unknown' for f in formats)
     
     def check_live_status(self, username):
         """Main live detection method with enhanced reliability"""
         try:
-            clean_username = username.replace('@', '').strip()
-            
-            # Primary method: yt-dlp
-            logger.debug(f"🔍 Checking {username} with yt-dlp...")
-            is_live_ytdlp, stream_info = self.check_live_with_ytdlp(username)
+            # Cheap page probe first; the full extractor only runs when a stream may exist
+            probe = self.probe_live_page(username)
+            if probe is False:
+                logger.info("❌ %s is not live", username)
+                return False, None
+            
+            # Primary method: yt-dlp (also supplies the stream info needed to record)
+            logger.debug("🔍 Checking %s with yt-dlp...", username)
+            is_live_ytdlp, stream_info, transient = self.check_live_with_ytdlp(username)
+            
+            # Retry only transient failures; a definitive "not live" answer is final
+            attempt = 0
+            while transient and attempt < YTDLP_TRANSIENT_RETRIES:
+                time.sleep(2 ** attempt)  # 1s, 2s backoff
+                attempt += 1
+                logger.debug("🔍 Retry %s check for %s...", attempt, username)
+                is_live_ytdlp, stream_info, transient = self.check_live_with_ytdlp(username)
             
             if is_live_ytdlp and stream_info:
                 return True, stream_info
             
-            # If yt-dlp fails, wait and try once more
-            if not is_live_ytdlp:
-                time.sleep(3)  # Brief delay
-                logger.debug(f"🔍 Retry check for {username}...")
-                is_live_retry, stream_info_retry = self.check_live_with_ytdlp(username)
-                if is_live_retry and stream_info_retry:
-                    return True, stream_info_retry
-            
-            logger.info(f"❌ {username} is not live")
+            logger.info("❌ %s is not live", username)
             return False, None
             
         except Exception as e:
-            logger.error(f"❌ Live detection error for {username}: {e}")
+            logger.error("❌ Live detection error for %s: %s", username, e)
             return False, None
 
 class StreamRecorder:
     def __init__(self):
         self.live_detector = TikTokLiveDetector()
         self.recording_files = {}  # Track active recording files to prevent duplicates
-        self.upload_queue = []
-        self.upload_lock = Lock()
+        self._reserved_filenames = set()  # Values of recording_files, for O(1) lookups
+        self.starting_recordings = set()  # Users reserved by an in-flight start_recording
+        self._usernames_cache = {'mtime': -1, 'data': [], 'members': frozenset()}
+        self._usernames_lock = Lock()  # Serializes read-modify-write of usernames.txt
+        self.live_cache = {}  # username -> (expires_at, (is_live, stream_info))
+        self.live_cache_lock = Lock()
+        self.live_checks_inflight = {}  # username -> Future shared by concurrent callers
+        self.dirs_ensured = set()  # Local folders already created by this process
+        self.drive_folders_ensured = set()  # Users whose Drive folders already exist
+        self._folder_id_cache = {}  # (parent_id, folder_name) -> Drive folder id
+        self._folder_cache_lock = Lock()
+        self.upload_q = queue.Queue(maxsize=UPLOAD_QUEUE_SIZE)
+        self._upload_workers_pid = None
+        self._upload_workers_lock = Lock()
+        self.uploads_pending = set()  # File paths queued or uploading, to avoid double uploads
+        self.user_upload_locks = {}  # username -> Lock serializing that user's uploads
+        self.upload_state_lock = Lock()
+        self._supervisor_pid = None
+        self._exit_poller = None  # epoll over ffmpeg pidfds, created with the supervisor
+        self._supervisor_wake_r = None  # Pipe registered in the poller to wake the supervisor
+        self._supervisor_wake_w = None
         self.ensure_directories()
+    
+    @property
+    def recording_pool(self):
+        """Bounded pool finishing recordings whose ffmpeg has exited"""
+        return get_pool("Recording", MAX_CONCURRENT_RECORDINGS)
+    
+    def _ensure_supervisor(self):
+        """Start the recording supervisor thread once per process"""
+        pid = os.getpid()
+        if self._supervisor_pid == pid:
+            return
+        with self._upload_workers_lock:
+            if self._supervisor_pid == pid:
+                return
+            # A forked child must not share the parent's epoll set
+            if hasattr(select, 'epoll') and hasattr(os, 'pidfd_open'):
+                self._exit_poller = select.epoll()
+                self._supervisor_wake_r, self._supervisor_wake_w = os.pipe()
+                os.set_blocking(self._supervisor_wake_r, False)
+                os.set_blocking(self._supervisor_wake_w, False)
+                self._exit_poller.register(self._supervisor_wake_r, select.EPOLLIN)
+            else:
+                self._exit_poller = None
+                self._supervisor_wake_r = self._supervisor_wake_w = None
+            threading.Thread(target=self._supervise_recordings, name="RecordingSupervisor", daemon=True).start()
+            self._supervisor_pid = pid
+    
+    def _ensure_upload_workers(self):
+        """Start the upload worker threads once per process"""
+        # Keyed by PID like get_pool, so forked workers start their own threads
+        pid = os.getpid()
+        if self._upload_workers_pid == pid:
+            return
+        with self._upload_workers_lock:
+            if self._upload_workers_pid == pid:
+                return
+            for i in range(UPLOAD_WORKERS):
+                threading.Thread(target=self._upload_worker, name=f"UploadProcessor-{i}", daemon=True).start()
+            self._upload_workers_pid = pid
+    
+    def enqueue_upload(self, upload_item, journal=True):
+        """Queue a finished recording for upload, blocking while the queue is full"""
+        with self.upload_state_lock:
+            if upload_item['filepath'] in self.uploads_pending:
+                logger.info("☁️ Upload already pending for %s", upload_item['filepath'])
+                return False
+            self.uploads_pending.add(upload_item['filepath'])
+            if journal:
+                self._journal_upload(upload_item)
+        self._ensure_upload_workers()
+        self.upload_q.put(upload_item)
+        return True
+    
+    def _upload_worker(self):
+        """Long-lived worker draining the upload queue"""
+        while True:
+            upload_item = self.upload_q.get()
+            try:
+                self._process_upload(upload_item)
+            except Exception as e:
+                logger.error("❌ Upload worker error for %s: %s", upload_item.get('username'), e)
+            finally:
+                with self.upload_state_lock:
+                    self.uploads_pending.discard(upload_item['filepath'])
+                    self._compact_upload_journal()
+                self.upload_q.task_done()
+    
+    def _journal_upload(self, upload_item):
+        """Append a queued upload to the on-disk journal (caller holds upload_state_lock)"""
+        entry = {
+            'filepath': upload_item['filepath'],
+            'username': upload_item['username'],
+            'timestamp': upload_item['timestamp'].isoformat()
+        }
+        try:
+            with open(UPLOAD_JOURNAL_FILE, 'ab') as f:
+                f.write(orjson.dumps(entry) + b'\n')
+        except OSError as e:
+            logger.warning("⚠️ Could not journal upload for %s: %s", upload_item['filepath'], e)
+    
+    def _read_upload_journal(self):
+        """Journal entries whose recording is still on disk (uploaded files are deleted)"""
+        try:
+            with open(UPLOAD_JOURNAL_FILE, 'rb') as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return []
+        
+        entries = {}
+        for line in lines:
+            try:
+                entry = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                continue  # Torn write from a crash
+            if os.path.exists(entry.get('filepath', '')):
+                entries[entry['filepath']] = entry
+        return list(entries.values())
+    
+    def _compact_upload_journal(self):
+        """Rewrite the journal without finished uploads (caller holds upload_state_lock)"""
+        try:
+            entries = self._read_upload_journal()
+            if not entries:
+                Path(UPLOAD_JOURNAL_FILE).unlink(missing_ok=True)
+                return
+            tmp_path = UPLOAD_JOURNAL_FILE + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(b''.join(orjson.dumps(entry) + b'\n' for entry in entries))
+            os.replace(tmp_path, UPLOAD_JOURNAL_FILE)
+        except OSError as e:
+            logger.warning("⚠️ Could not compact upload journal: %s", e)
+    
+    def restore_pending_uploads(self):
+        """Re-queue uploads left in the journal by a previous run"""
+        with self.upload_state_lock:
+            entries = self._read_upload_journal()
+        
+        restored = 0
+        for entry in entries:
+            try:
+                timestamp = datetime.fromisoformat(entry['timestamp'])
+            except (KeyError, TypeError, ValueError):
+                timestamp = datetime.now()
+            upload_item = {
+                'filepath': entry['filepath'],
+                'username': entry['username'],
+                'timestamp': timestamp,
+                'restored': True  # A previous run may have finished this upload
+            }
+            if self.enqueue_upload(upload_item, journal=False):
+                restored += 1
+        if restored:
+            logger.info("☁️ Re-queued %s pending uploads from the journal", restored)
+    
+    def recover_partial_recordings(self):
+        """Finalize or delete .part files left by recordings that never completed (crash, OOM, SIGKILL)"""
+        active = {info['filepath'] for info in snapshot_recordings().values()}
+        now = time.time()
+        recovered = removed = 0
+        try:
+            user_dirs = [entry for entry in os.scandir(RECORDINGS_DIR) if entry.is_dir()]
+        except FileNotFoundError:
+            return recovered, removed
+        
+        for user_dir in user_dirs:
+            with os.scandir(user_dir.path) as entries:
+                parts = [entry for entry in entries if entry.name.endswith(PART_SUFFIX) and entry.path not in active]
+            for entry in parts:
+                try:
+                    stat = entry.stat()
+                    # A recently written file may belong to an ffmpeg that outlived its worker
+                    if now - stat.st_mtime < STALE_PART_AGE:
+                        continue
+                    if stat.st_size <= MIN_RECORDING_BYTES:
+                        Path(entry.path).unlink(missing_ok=True)
+                        removed += 1
+                        continue
+                    # Fragmented MP4 stays playable without the trailer, so the file can be kept as is
+                    final_path = entry.path[:-len(PART_SUFFIX)]
+                    os.replace(entry.path, final_path)
+                except OSError as e:
+                    logger.warning("⚠️ Could not recover %s: %s", entry.path, e)
+                    continue
+                
+                upload_item = {
+                    'filepath': final_path,
+                    'username': user_dir.name,
+                    'timestamp': datetime.fromtimestamp(stat.st_mtime)
+                }
+                if drive_service:
+                    self.enqueue_upload(upload_item)
+                else:
+                    # Queued by restore_pending_uploads once Drive is authorized
+                    with self.upload_state_lock:
+                        self._journal_upload(upload_item)
+                recovered += 1
+        
+        if recovered or removed:
+            logger.info("♻️ Recovered %s interrupted recordings, removed %s too small to keep", recovered, removed)
+        return recovered, removed
         
     def ensure_directories(self):
         """Create necessary directories"""
@@ -234,8 +765,14 @@ class StreamRecorder:
                 f.write("# Lines starting with # are comments\n\n")
     
     def load_usernames(self):
-        """Load usernames from file"""
+        """Load usernames from file, re-reading only when its mtime changes (shared list: do not mutate)"""
         try:
+            st = os.stat(USERNAMES_FILE)
+            mtime = (st.st_mtime_ns, st.st_size)
+            cache = self._usernames_cache
+            if mtime == cache['mtime']:
+                return cache['data']
+            
             with open(USERNAMES_FILE, 'r', encoding='utf-8') as f:
                 usernames = []
                 for line in f:
@@ -244,22 +781,47 @@ class StreamRecorder:
                         username = line.replace('@', '').strip()
                         if username:
                             usernames.append(username)
-                return list(set(usernames))  # Remove duplicates
+            
+            data = list(dict.fromkeys(usernames))  # Remove duplicates, keep file order
+            self._usernames_cache = {'mtime': mtime, 'data': data, 'members': frozenset(data)}
+            return data
         except FileNotFoundError:
             return []
     
     def save_usernames(self, usernames):
-        """Save usernames to file"""
+        """Save usernames to file atomically (write a temp file, then rename over the original)"""
         try:
-            with open(USERNAMES_FILE, 'w', encoding='utf-8') as f:
-                f.write("# TikTok Livestream Recorder - Usernames\n")
-                f.write("# Add usernames below (one per line, without @)\n\n")
-                for username in sorted(set(usernames)):
-                    if username.strip():
-                        f.write(f"{username.strip()}\n")
-            logger.info(f"💾 Saved {len(usernames)} usernames to file")
+            tmp_path = USERNAMES_FILE + '.tmp'
+            body = (
+                "# TikTok Livestream Recorder - Usernames\n"
+                "# Add usernames below (one per line, without @)\n\n"
+                + ''.join(f"{username}\n" for username in sorted({u.strip() for u in usernames} - {''}))
+            )
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(body)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, USERNAMES_FILE)
+            self._usernames_cache = {'mtime': -1, 'data': [], 'members': frozenset()}
+            logger.info("💾 Saved %s usernames to file", len(usernames))
         except Exception as e:
-            logger.error(f"❌ Error saving usernames: {e}")
+            logger.error("❌ Error saving usernames: %s", e)
+    
+    def is_monitored(self, username):
+        """O(1) membership test against the cached username set"""
+        self.load_usernames()
+        return username in self._usernames_cache['members']
+    
+    def append_username(self, username):
+        """Append a single username without rewriting the file"""
+        with open(USERNAMES_FILE, 'a+b') as f:
+            needs_newline = False
+            if f.seek(0, os.SEEK_END) > 0:
+                f.seek(-1, os.SEEK_END)
+                needs_newline = f.read(1) != b'\n'
+            prefix = b'\n' if needs_newline else b''
+            f.write(prefix + f"{username}\n".encode('utf-8'))
+        self._usernames_cache = {'mtime': -1, 'data': [], 'members': frozenset()}
     
     def add_username(self, username):
         """Add a username to monitoring list"""
@@ -267,49 +829,92 @@ class StreamRecorder:
         if not username:
             return False
             
-        usernames = self.load_usernames()
-        if username not in usernames:
-            usernames.append(username)
-            self.save_usernames(usernames)
-            self.create_user_folder(username)
-            logger.info(f"➕ Added username: {username}")
-            return True
-        return False
+        with self._usernames_lock:
+            if self.is_monitored(username):
+                return False
+            self.append_username(username)
+        logger.info("➕ Added username: %s", username)
+        return True
     
     def remove_username(self, username):
         """Remove a username from monitoring list"""
         username = username.replace('@', '').strip()
-        usernames = self.load_usernames()
-        if username in usernames:
-            usernames.remove(username)
-            self.save_usernames(usernames)
-            # Stop recording if active
-            if username in recording_processes:
-                self.stop_recording(username)
-            logger.info(f"➖ Removed username: {username}")
-            return True
-        return False
+        with self._usernames_lock:
+            usernames = self.load_usernames()
+            if username not in usernames:
+                return False
+            self.save_usernames([u for u in usernames if u != username])
+        
+        next_check.pop(username, None)
+        consecutive_offline.pop(username, None)
+        last_seen_live.pop(username, None)
+        # Stop recording if active
+        if username in recording_processes:
+            self.stop_recording(username)
+        with self.live_cache_lock:
+            self.live_cache.pop(username, None)
+        self.dirs_ensured.discard(os.path.join(RECORDINGS_DIR, username))
+        self.drive_folders_ensured.discard(username)
+        logger.info("➖ Removed username: %s", username)
+        return True
     
     def create_user_folder(self, username):
-        """Create folder structure for user"""
+        """Create folder structure for user (once per process)"""
         user_dir = os.path.join(RECORDINGS_DIR, username)
-        os.makedirs(user_dir, exist_ok=True)
-        logger.info(f"📁 Created folder for {username}")
+        if user_dir not in self.dirs_ensured:
+            os.makedirs(user_dir, exist_ok=True)
+            self.dirs_ensured.add(user_dir)
+            logger.info("📁 Created folder for %s", username)
         
         # Also create Google Drive folder if service is available
-        if drive_service:
+        service = get_drive_service() if username not in self.drive_folders_ensured else None
+        if service:
             try:
-                main_folder_id = self.get_or_create_folder(drive_service, "TikTok_Recordings")
+                main_folder_id = self.get_or_create_folder(service, "TikTok_Recordings")
                 if main_folder_id:
-                    user_folder_id = self.get_or_create_folder(drive_service, username, main_folder_id)
+                    user_folder_id = self.get_or_create_folder(service, username, main_folder_id)
                     if user_folder_id:
-                        logger.info(f"☁️ Created Drive folder for {username}")
+                        self.drive_folders_ensured.add(username)
+                        logger.info("☁️ Created Drive folder for %s", username)
             except Exception as e:
-                logger.error(f"❌ Error creating Drive folder for {username}: {e}")
+                logger.error("❌ Error creating Drive folder for %s: %s", username, e)
     
     def check_live_status(self, username):
-        """Check if user is live using enhanced detection"""
-        return self.live_detector.check_live_status(username)
+        """Check if user is live using enhanced detection and refresh the cache"""
+        with self.live_cache_lock:
+            inflight = self.live_checks_inflight.get(username)
+            if inflight is None:
+                inflight = self.live_checks_inflight[username] = Future()
+                owner = True
+            else:
+                owner = False
+        
+        # Another thread is already probing this user; share its result
+        if not owner:
+            return inflight.result()
+        
+        result = (False, None)
+        try:
+            result = self.live_detector.check_live_status(username)
+        finally:
+            with self.live_cache_lock:
+                self.live_cache[username] = (time.monotonic() + LIVE_CACHE_TTL, result)
+                self.live_checks_inflight.pop(username, None)
+            inflight.set_result(result)
+        return result
+    
+    def check_live_status_cached(self, username):
+        """Return a recent live check result if available, otherwise check now"""
+        with self.live_cache_lock:
+            entry = self.live_cache.get(username)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+        return self.check_live_status(username)
+    
+    def is_process_healthy(self, username):
+        """Check if the user's ffmpeg process is still running"""
+        rec_info = recording_processes.get(username)  # Single atomic read, no lock needed
+        return rec_info is not None and rec_info['process'].poll() is None
     
     def get_unique_filename(self, username):
         """Generate unique filename to prevent duplicates"""
@@ -328,8 +933,8 @@ class StreamRecorder:
             filepath = os.path.join(user_dir, filename)
             
             # Check if file exists or is being recorded
-            if not os.path.exists(filepath) and filename not in self.recording_files.values():
-                self.recording_files[username] = filename
+            if filename not in self._reserved_filenames and not os.path.exists(filepath):
+                self._reserve_filename(username, filename)
                 return filename, filepath
             
             counter += 1
@@ -340,132 +945,172 @@ class StreamRecorder:
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
         filename = f"{username}_{timestamp}.mp4"
         filepath = os.path.join(user_dir, filename)
-        self.recording_files[username] = filename
+        self._reserve_filename(username, filename)
         return filename, filepath
     
+    def _reserve_filename(self, username, filename):
+        """Record the file a user is recording to"""
+        self._release_filename(username)
+        self.recording_files[username] = filename
+        self._reserved_filenames.add(filename)
+    
+    def _release_filename(self, username):
+        """Forget the file a user was recording to"""
+        self._reserved_filenames.discard(self.recording_files.pop(username, None))
+    
     def start_recording(self, username, stream_info=None):
         """Start recording with enhanced FFmpeg settings and duplicate prevention"""
         with active_recordings_lock:
+            if username in self.starting_recordings:
+                logger.info("📹 Recording for %s is already starting", username)
+                return False
+            
             if username in recording_processes:
                 # Check if existing process is still alive
                 existing_process = recording_processes[username]['process']
                 if existing_process.poll() is None:
-                    logger.info(f"📹 Already recording {username} (active process)")
+                    logger.info("📹 Already recording %s (active process)", username)
                     return False
                 else:
                     # Clean up dead process
-                    logger.warning(f"🧹 Cleaning up dead recording process for {username}")
+                    logger.warning("🧹 Cleaning up dead recording process for %s", username)
                     del recording_processes[username]
-                    if username in self.recording_files:
-                        del self.recording_files[username]
+                    self._release_filename(username)
+            
+            if len(recording_processes) + len(self.starting_recordings) >= MAX_CONCURRENT_RECORDINGS:
+                logger.warning("⚠️ Recording limit reached (%s), not recording %s", MAX_CONCURRENT_RECORDINGS, username)
+                return False
+            
+            # Reserve the user atomically so concurrent callers cannot start a duplicate
+            self.starting_recordings.add(username)
         
+        process_info = pidfd = None
         try:
             # Ensure user folder exists
             self.create_user_folder(username)
             
             # Get stream URL using yt-dlp if not provided
             if not stream_info:
-                logger.info(f"🔗 Getting stream URL for {username}...")
-                is_live, stream_info = self.live_detector.check_live_with_ytdlp(username)
+                logger.info("🔗 Getting stream URL for %s...", username)
+                is_live, stream_info = self.check_live_status_cached(username)
                 if not is_live or not stream_info:
-                    logger.error(f"❌ Cannot get stream info for {username}")
+                    logger.error("❌ Cannot get stream info for %s", username)
                     return False
             
             # Extract best quality stream URL (480p max)
             stream_url = self._extract_best_stream_url(stream_info)
             if not stream_url:
-                logger.error(f"❌ No valid stream URL found for {username}")
+                # Liveness checks skip format resolution; resolve fully now that we need the URL
+                _, resolved_info, _ = self.live_detector.check_live_with_ytdlp(username, process=True)
+                if resolved_info:
+                    stream_info = resolved_info
+                    stream_url = self._extract_best_stream_url(stream_info)
+            if not stream_url:
+                logger.error("❌ No valid stream URL found for %s", username)
                 return False
             
             # Generate unique filename
-            filename, filepath = self.get_unique_filename(username)
-            
-            logger.info(f"🎬 Starting recording for {username}")
-            logger.info(f"📁 Output: {filepath}")
-            logger.info(f"🔗 Stream URL: {stream_url[:100]}...")
-            
-            # Enhanced FFmpeg command for reliable recording with better compatibility
-            cmd = [
-                'ffmpeg',
-                '-headers', f'User-Agent: {self.live_detector.user_agents[0]}',
-                '-headers', 'Referer: https://www.tiktok.com/',
-                '-i', stream_url,
-                '-c:v', 'libx264',
-                '-c:a', 'aac',
-                '-preset', 'medium',           # Better quality
-                '-crf', '26',                  # Better quality for 480p
-                '-maxrate', '1500k',           # Increased bitrate
-                '-bufsize', '3000k',           # Larger buffer
-                '-vf', 'scale=-2:480:flags=lanczos',  # Better scaling
-                '-movflags', '+faststart+frag_keyframe+empty_moov',  # Better streaming compatibility
-                '-f', 'mp4',                   # Ensure MP4 format
-                '-avoid_negative_ts', 'make_zero',  # Fix timestamp issues
-                '-fflags', '+genpts',          # Generate presentation timestamps
-                '-reconnect', '1',
-                '-reconnect_streamed', '1',
-                '-reconnect_delay_max', '15',
-                '-rw_timeout', '20000000',     # 20 second timeout
-                '-analyzeduration', '10000000', # 10 seconds analysis
-                '-probesize', '10000000',      # 10MB probe size
-                '-thread_queue_size', '512',   # Larger thread queue
-                '-y',                          # Overwrite output file
-                filepath
-            ]
+            filename, final_path = self.get_unique_filename(username)
+            filepath = final_path + PART_SUFFIX
+            
+            logger.info("🎬 Starting recording for %s", username)
+            logger.info("📁 Output: %s", final_path)
+            logger.info("🔗 Stream URL: %s...", stream_url[:100])
+            
+            # Assemble the FFmpeg command from the prebuilt argument tuples
+            cmd = [*FFMPEG_INPUT_ARGS, '-headers', self.live_detector.ffmpeg_ua_header, *FFMPEG_PROTOCOL_ARGS]
+            if '.m3u8' in stream_url:
+                cmd += FFMPEG_HLS_ARGS
+            cmd += ['-i', stream_url]
+            if self._can_stream_copy(stream_info, stream_url):
+                # Source is already H.264 at <=480p: remux without re-encoding
+                logger.info("⚡ Stream-copying %s (no transcode)", username)
+                cmd += FFMPEG_COPY_ARGS
+            else:
+                cmd += FFMPEG_TRANSCODE_ARGS
+            cmd += FFMPEG_OUTPUT_ARGS
+            cmd.append(filepath)
+            
+            # The supervisor's poller must exist before the exit watch is registered
+            self._ensure_supervisor()
             
             # Start FFmpeg process with better settings
             process = subprocess.Popen(
                 cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                universal_newlines=True,
-                bufsize=1,
-                preexec_fn=os.setsid if hasattr(os, 'setsid') else None  # Create process group
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,     # Nothing is written to stdout; output goes to the file
+                stderr=subprocess.PIPE,        # Binary; drained by the progress reader thread
+                close_fds=True,
+                start_new_session=True         # Own process group, without a preexec_fn callback
             )
+            # Open the pidfd before anything else can see, and so reap, the process
+            pidfd = self._watch_exit(process)
             
             # Store recording info
+            start_time = datetime.now()
+            process_info = {
+                'process': process,
+                'pidfd': pidfd,
+                'filename': filename,
+                'filepath': filepath,
+                'final_path': final_path,
+                'start_time': start_time,
+                'start_time_formatted': start_time.strftime('%H:%M:%S'),
+                'stream_url': stream_url,
+                'stream_info': stream_info,
+                # Filled in from ffmpeg's -progress output; start with a probing grace period
+                'last_progress': time.monotonic() + RECORDING_STALL_TIMEOUT,
+                'out_time': None,
+                'bytes_written': 0,
+                'stderr_tail': deque(maxlen=20),
+                'start_mono': time.monotonic(),
+                'last_log': time.monotonic(),
+                'stop_requested': None,  # Monotonic time SIGINT was sent by the supervisor
+                'finishing': False,
+                'finished': threading.Event()  # Set once the file is renamed and queued (or dropped)
+            }
             with active_recordings_lock:
-                recording_processes[username] = {
-                    'process': process,
-                    'filename': filename,
-                    'filepath': filepath,
-                    'start_time': datetime.now(),
-                    'stream_url': stream_url,
-                    'stream_info': stream_info,
-                    'last_size_check': 0,
-                    'stall_count': 0
-                }
-            
-            logger.info(f"✅ Recording started for {username} (PID: {process.pid})")
+                recording_processes[username] = process_info
+                user_state[username] = STATE_RECORDING
             
-            # Start monitoring thread for this recording
-            monitor_thread = threading.Thread(
-                target=self.monitor_recording,
-                args=(username,),
+            # ffmpeg's stderr must be drained continuously or the pipe fills and stalls it
+            reader = threading.Thread(
+                target=self._read_ffmpeg_progress,
+                args=(process, process_info),
                 daemon=True,
-                name=f"RecordingMonitor-{username}"
+                name=f"FFmpegProgress-{username}"
             )
-            monitor_thread.start()
+            process_info['reader'] = reader
+            reader.start()
+            
+            logger.info("✅ Recording started for %s (PID: %s)", username, process.pid)
+            # Schedule the new recording's deadlines; also catches an ffmpeg that already exited
+            self._wake_supervisor()
             
             return True
             
         except Exception as e:
-            logger.error(f"❌ Error starting recording for {username}: {e}")
+            logger.error("❌ Error starting recording for %s: %s", username, e)
             logger.error(traceback.format_exc())
             # Clean up if failed
             with active_recordings_lock:
                 if username in recording_processes:
                     del recording_processes[username]
-                if username in self.recording_files:
-                    del self.recording_files[username]
+                self._release_filename(username)
+            self._unwatch_exit(process_info or {'pidfd': pidfd})
             return False
+        
+        finally:
+            with active_recordings_lock:
+                self.starting_recordings.discard(username)
     
     def _extract_best_stream_url(self, stream_info):
         """Extract the best stream URL from yt-dlp info"""
         if not stream_info:
             return None
             
-        # Direct URL
-        if stream_info.get('url'):
+        # Direct URL (an unresolved '_type: url' result points at a page, not a stream)
+        if stream_info.get('url') and stream_info.get('_type') not in ('url', 'url_transparent'):
             return stream_info['url']
         
         # From formats
@@ -479,9 +1124,9 @@ class StreamRecorder:
             if not fmt.get('url'):
                 continue
                 
-            height = fmt.get('height', 0)
-            width = fmt.get('width', 0)
-            fps = fmt.get('fps', 0)
+            # Unresolved formats may carry None for unknown dimensions
+            height = fmt.get('height') or 0
+            fps = fmt.get('fps') or 0
             
             # Prefer formats under 480p with reasonable fps
             if height <= 480 and fps <= 60:
@@ -495,161 +1140,291 @@ class StreamRecorder:
             return None
         
         # Sort by quality (prefer higher quality within limits)
-        valid_formats.sort(key=lambda f: (f.get('height', 0), f.get('fps', 0)), reverse=True)
+        valid_formats.sort(key=lambda f: (f.get('height') or 0, f.get('fps') or 0), reverse=True)
         
         return valid_formats[0]['url']
     
-    def monitor_recording(self, username):
-        """Enhanced recording monitoring with better stall detection"""
+    def _can_stream_copy(self, stream_info, stream_url):
+        """Return True when the source is already H.264 at <=480p and can be copied as-is"""
+        if stream_info.get('url') == stream_url:
+            fmt = stream_info
+        else:
+            fmt = next((f for f in stream_info.get('formats', []) if f.get('url') == stream_url), {})
+        
+        vcodec, height = fmt.get('vcodec'), fmt.get('height')
+        if not vcodec or vcodec == 'none' or not height:
+            probed = self.probe_stream(stream_url)
+            if not probed:
+                return False
+            vcodec, height = probed
+        
+        return vcodec.startswith(('h264', 'avc1')) and height <= 480
+    
+    def probe_stream(self, stream_url):
+        """Ask ffprobe for the first video stream's (codec, height), or None if unknown"""
+        cmd = [
+            'ffprobe', '-v', 'quiet',
+            '-headers', self.live_detector.ffmpeg_ua_header,
+            '-select_streams', 'v:0',
+            '-show_entries', 'stream=codec_name,height',
+            '-of', 'csv=p=0',
+            stream_url
+        ]
         try:
-            if username not in recording_processes:
-                return
-            
-            process_info = recording_processes[username]
-            process = process_info['process']
-            filepath = process_info['filepath']
-            start_time = process_info['start_time']
-            
-            logger.info(f"👁️ Monitoring recording for {username}")
-            
-            last_size = 0
-            stall_count = 0
-            last_log_time = datetime.now()
-            
-            while process.poll() is None:
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=FFPROBE_TIMEOUT)
+            codec, _, height = result.stdout.strip().partition(',')
+            return codec, int(height)
+        except (subprocess.TimeoutExpired, OSError, ValueError):
+            return None
+    
+    def _read_ffmpeg_progress(self, process, process_info):
+        """Consume ffmpeg's stderr, tracking -progress output and keeping recent log lines"""
+        if process.stderr is None:
+            return
+        try:
+            for line in process.stderr:
+                key, sep, value = line.rstrip().partition(b'=')
+                if not sep or key not in FFMPEG_PROGRESS_KEYS:
+                    # Only log lines are decoded; progress lines stay bytes
+                    process_info['stderr_tail'].append(line.rstrip().decode('utf-8', 'replace'))
+                elif key == b'out_time_us':
+                    # Media time advancing is the only reliable sign the stream is flowing
+                    if value != process_info['out_time']:
+                        process_info['out_time'] = value
+                        process_info['last_progress'] = time.monotonic()
+                elif key == b'total_size' and value.isdigit():
+                    process_info['bytes_written'] = int(value)
+        except (OSError, ValueError):
+            pass  # Pipe closed while ffmpeg was shutting down
+    
+    def _supervise_recordings(self):
+        """Single thread watching every ffmpeg process for exits, the duration limit and stalls"""
+        timeout = None
+        while True:
+            self._wait_for_exit(timeout)
+            now = time.monotonic()
+            deadline = None
+            for username, process_info in snapshot_recordings().items():
                 try:
-                    # Check recording duration limit
-                    duration = datetime.now() - start_time
-                    if duration.total_seconds() > MAX_RECORDING_DURATION:
-                        logger.info(f"⏰ Recording duration limit reached for {username}")
-                        process.terminate()
-                        break
-                    
-                    # Check if file exists and is growing
-                    if os.path.exists(filepath):
-                        current_size = os.path.getsize(filepath)
-                        
-                        # Check for file growth
-                        if current_size > last_size:
-                            stall_count = 0
-                            process_info['last_size_check'] = current_size
-                            
-                            # Log progress every 2 minutes
-                            if datetime.now() - last_log_time > timedelta(minutes=2):
-                                logger.info(f"📊 {username}: {duration.total_seconds():.0f}s, {current_size/1024/1024:.1f}MB")
-                                last_log_time = datetime.now()
-                        else:
-                            stall_count += 1
-                            if stall_count > 8:  # 80 seconds without growth
-                                logger.warning(f"⚠️ Recording stalled for {username}, stopping...")
-                                process.terminate()
-                                break
-                        
-                        last_size = current_size
-                    else:
-                        logger.warning(f"⚠️ Recording file not found: {filepath}")
-                        stall_count += 1
-                        if stall_count > 5:
-                            break
-                    
-                    time.sleep(10)  # Check every 10 seconds
-                    
+                    due = self._supervise_recording(username, process_info, now)
                 except Exception as e:
-                    logger.error(f"❌ Error in recording monitor for {username}: {e}")
-                    break
-            
-            # Process ended - handle cleanup
-            self._handle_recording_completion(username)
-                
+                    logger.error("❌ Error in recording supervisor for %s: %s", username, e)
+                    due = now + PROGRESS_CHECK_INTERVAL
+                if due is not None and (deadline is None or due < deadline):
+                    deadline = due
+            # Sleep until the earliest limit, stall or log deadline unless an exit or a new recording wakes us
+            timeout = None if deadline is None else max(deadline - now, 0.01)
+    
+    def _wait_for_exit(self, timeout):
+        """Block until a watched ffmpeg exits, the supervisor is woken, or timeout (None: no deadline) passes"""
+        poller = self._exit_poller
+        if poller is None:
+            # Exits cannot be watched here, so fall back to polling
+            time.sleep(PROGRESS_CHECK_INTERVAL if timeout is None else min(timeout, PROGRESS_CHECK_INTERVAL))
+            return
+        try:
+            events = poller.poll(-1 if timeout is None else timeout)
+        except OSError:
+            time.sleep(PROGRESS_CHECK_INTERVAL)
+            return
+        if any(fd == self._supervisor_wake_r for fd, _ in events):
+            try:
+                while os.read(self._supervisor_wake_r, 4096):
+                    pass
+            except BlockingIOError:
+                pass
+    
+    def _wake_supervisor(self):
+        """Make the supervisor run a pass now, e.g. to schedule a new recording's deadlines"""
+        fd = self._supervisor_wake_w
+        if fd is None:
+            return
+        try:
+            os.write(fd, b'\0')
+        except BlockingIOError:
+            pass  # A wake-up is already pending
+    
+    def _watch_exit(self, process):
+        """Open and register a pidfd for a new ffmpeg process so its exit wakes the supervisor; returns the fd or None"""
+        poller = self._exit_poller
+        if poller is None:
+            return None
+        try:
+            pidfd = os.pidfd_open(process.pid)
+        except OSError:
+            return None  # No pidfd support: the supervisor polls this recording instead
+        try:
+            # One-shot so an exited process cannot keep waking the poller
+            poller.register(pidfd, select.EPOLLIN | select.EPOLLONESHOT)
+        except OSError:
+            os.close(pidfd)
+            return None
+        return pidfd
+    
+    def _unwatch_exit(self, process_info):
+        """Drop and close the pidfd registered for a recording, if any"""
+        pidfd = process_info.pop('pidfd', None)
+        if pidfd is None:
+            return
+        try:
+            if self._exit_poller is not None:
+                self._exit_poller.unregister(pidfd)
+        except (OSError, ValueError):
+            pass
+        os.close(pidfd)
+    
+    def _supervise_recording(self, username, process_info, now):
+        """One supervisor pass over a single recording; returns when it next needs attention, or None"""
+        if process_info.get('finishing'):
+            return None
+        process = process_info['process']
+        
+        if process.poll() is not None:
+            # ffmpeg exited: finalize off the supervisor thread, then drop the entry
+            self._unwatch_exit(process_info)
+            process_info['finishing'] = True
+            future = self.recording_pool.submit(self._finish_recording, username, process_info)
+            future.add_done_callback(lambda f, u=username, p=process: self._cleanup_recording(u, p))
+            return None
+        
+        pidfd = process_info.get('pidfd')
+        if pidfd is not None:
+            # Re-arm the one-shot watch: poll() reports None while another thread is in wait(),
+            # so an exit consumed by this pass must be able to wake the next one
+            self._exit_poller.modify(pidfd, select.EPOLLIN | select.EPOLLONESHOT)
+            poll_due = None
+        else:
+            # Without a pidfd an exit is only noticed by polling
+            poll_due = now + PROGRESS_CHECK_INTERVAL
+        
+        stop_requested = process_info.get('stop_requested')
+        if stop_requested is not None:
+            if now - stop_requested > FFMPEG_EXIT_TIMEOUT:
+                logger.warning("🔪 ffmpeg did not exit for %s, killing", username)
+                process.kill()
+                return now + PROGRESS_CHECK_INTERVAL
+            return min(stop_requested + FFMPEG_EXIT_TIMEOUT, poll_due or float('inf'))
+        
+        elapsed = now - process_info['start_mono']
+        if elapsed > MAX_RECORDING_DURATION:
+            logger.info("⏰ Recording duration limit reached for %s", username)
+        elif now - process_info['last_progress'] > RECORDING_STALL_TIMEOUT:
+            logger.warning("⚠️ Recording stalled for %s, stopping...", username)
+        else:
+            if now - process_info['last_log'] > PROGRESS_LOG_INTERVAL:
+                logger.info("📊 %s: %.0fs, %.1fMB", username, elapsed, process_info['bytes_written'] / BYTES_PER_MB)
+                process_info['last_log'] = now
+            # Progress moves the stall deadline later; it is re-evaluated when this one passes
+            return min(
+                process_info['start_mono'] + MAX_RECORDING_DURATION,
+                process_info['last_progress'] + RECORDING_STALL_TIMEOUT,
+                process_info['last_log'] + PROGRESS_LOG_INTERVAL,
+                poll_due or float('inf')
+            )
+        
+        process.send_signal(signal.SIGINT)  # Lets ffmpeg flush and write the trailer
+        process_info['stop_requested'] = now
+        return min(now + FFMPEG_EXIT_TIMEOUT, poll_due or float('inf'))
+    
+    def _finish_recording(self, username, process_info):
+        """Collect an exited ffmpeg's output and hand the file to completion handling"""
+        try:
+            process = process_info['process']
+            process.wait()
+            reader = process_info.get('reader')
+            if reader is not None:
+                reader.join(timeout=5)
+            if process.returncode and process_info['stderr_tail']:
+                logger.warning("⚠️ ffmpeg output for %s: %s", username, ' | '.join(process_info['stderr_tail']))
+            
+            # Cleanup runs in the done callback
+            self._handle_recording_completion(username, process_info)
         except Exception as e:
-            logger.error(f"❌ Error monitoring recording for {username}: {e}")
-            self._cleanup_recording(username)
+            logger.error("❌ Error finishing recording for %s: %s", username, e)
+        finally:
+            process_info['finished'].set()
     
-    def _handle_recording_completion(self, username):
-        """Handle recording completion and upload"""
+    def _handle_recording_completion(self, username, process_info):
+        """Handle recording completion and upload for the recording described by process_info"""
         try:
-            if username not in recording_processes:
-                return
-            
-            process_info = recording_processes[username]
+            # Use this recording's own entry; a newer one may already be registered for the user
             process = process_info['process']
             filepath = process_info['filepath']
             start_time = process_info['start_time']
             
             return_code = process.returncode
-            duration = datetime.now() - start_time
+            now = datetime.now()
+            duration = now - start_time
             
             if return_code == 0:
-                logger.info(f"✅ Recording completed for {username} ({duration.total_seconds():.0f}s)")
+                logger.info("✅ Recording completed for %s (%.0fs)", username, duration.total_seconds())
             else:
-                logger.warning(f"⚠️ Recording ended with code {return_code} for {username}")
-            
-            # Check final file
-            if os.path.exists(filepath):
-                file_size = os.path.getsize(filepath)
-                if file_size > 100000:  # At least 100KB
-                    logger.info(f"💾 Recording saved: {filepath} ({file_size/1024/1024:.1f}MB)")
+                logger.warning("⚠️ Recording ended with code %s for %s", return_code, username)
+            
+            # Check final file (single stat instead of exists + getsize)
+            size = file_size(filepath)
+            if size is not None:
+                if size > MIN_RECORDING_BYTES:
+                    # Commit the finished recording under its real name
+                    final_path = process_info.get('final_path', filepath)
+                    os.replace(filepath, final_path)
+                    logger.info("💾 Recording saved: %s (%.1fMB)", final_path, size / BYTES_PER_MB)
                     
-                    # Add to upload queue
-                    with self.upload_lock:
-                        self.upload_queue.append({
-                            'filepath': filepath,
-                            'username': username,
-                            'timestamp': datetime.now()
-                        })
-                    
-                    # Start upload thread if not already running
-                    threading.Thread(
-                        target=self._process_upload_queue,
-                        daemon=True,
-                        name="UploadProcessor"
-                    ).start()
+                    # Hand off to the bounded upload queue; blocks only if uploads fall far behind
+                    self.enqueue_upload({
+                        'filepath': final_path,
+                        'username': username,
+                        'timestamp': now
+                    })
                 else:
-                    logger.warning(f"⚠️ Recording file too small: {filepath} ({file_size} bytes)")
-                    try:
-                        os.remove(filepath)
-                        logger.info(f"🗑️ Removed small file: {filepath}")
-                    except:
-                        pass
-            
-            # Clean up
-            self._cleanup_recording(username)
+                    logger.warning("⚠️ Recording file too small: %s (%s bytes)", filepath, size)
+                    Path(filepath).unlink(missing_ok=True)
+                    logger.info("🗑️ Removed small file: %s", filepath)
                 
         except Exception as e:
-            logger.error(f"❌ Error handling recording completion for {username}: {e}")
-            self._cleanup_recording(username)
+            logger.error("❌ Error handling recording completion for %s: %s", username, e)
     
-    def _cleanup_recording(self, username):
-        """Clean up recording process data"""
+    def _cleanup_recording(self, username, process=None):
+        """Clean up recording process data, optionally only for a specific process"""
         with active_recordings_lock:
+            rec_info = recording_processes.get(username)
+            if process is not None and (rec_info is None or rec_info['process'] is not process):
+                # A newer recording has replaced this one
+                return
+            if rec_info is not None:
+                self._unwatch_exit(rec_info)
             if username in recording_processes:
                 del recording_processes[username]
-            if username in self.recording_files:
-                del self.recording_files[username]
-        logger.info(f"🧹 Cleaned up recording process for {username}")
+            self._release_filename(username)
+            # ffmpeg has exited, so liveness must be re-checked over HTTP
+            user_state[username] = STATE_OFFLINE
+        publish_user_updates([username])
+        logger.info("🧹 Cleaned up recording process for %s", username)
     
     def stop_recording(self, username):
         """Stop recording for a user"""
+        # Read the entry once; the supervisor may drop it as soon as the lock is released
         with active_recordings_lock:
-            if username not in recording_processes:
-                return False
+            rec_info = recording_processes.get(username)
+        if rec_info is None:
+            return False
         
         try:
-            process = recording_processes[username]['process']
+            process = rec_info['process']
             
-            # Send SIGTERM for graceful shutdown
+            # Send SIGINT (like Ctrl-C) so ffmpeg flushes and finalizes the MP4
             try:
                 if hasattr(os, 'killpg'):
-                    os.killpg(os.getpgid(process.pid), signal.SIGTERM)
+                    os.killpg(os.getpgid(process.pid), signal.SIGINT)
                 else:
-                    process.terminate()
-            except:
-                process.terminate()
+                    process.send_signal(signal.SIGINT)
+            except Exception:
+                process.send_signal(signal.SIGINT)
             
             # Wait for graceful termination
             try:
-                process.wait(timeout=20)
-                logger.info(f"🛑 Gracefully stopped recording for {username}")
+                process.wait(timeout=RECORDING_STOP_TIMEOUT)
+                logger.info("🛑 Gracefully stopped recording for %s", username)
             except subprocess.TimeoutExpired:
                 # Force kill if needed
                 try:
@@ -658,161 +1433,213 @@ class StreamRecorder:
                     else:
                         process.kill()
                     process.wait()
-                except:
+                except Exception:
                     pass
-                logger.warning(f"🔪 Force killed recording for {username}")
+                logger.warning("🔪 Force killed recording for %s", username)
             
             return True
             
         except Exception as e:
-            logger.error(f"❌ Error stopping recording for {username}: {e}")
+            logger.error("❌ Error stopping recording for %s: %s", username, e)
             return False
     
-    def _process_upload_queue(self):
-        """Process upload queue with retry logic"""
-        while True:
-            with self.upload_lock:
-                if not self.upload_queue:
+    def _user_upload_lock(self, username):
+        """Return the lock serializing uploads for one user"""
+        with self.upload_state_lock:
+            return self.user_upload_locks.setdefault(username, Lock())
+    
+    def _process_upload(self, upload_item):
+        """Upload a finished recording with retry logic"""
+        # One upload per user at a time keeps the Drive duplicate-name check race-free
+        with self._user_upload_lock(upload_item['username']):
+            self._upload_with_retries(upload_item)
+    
+    def _upload_with_retries(self, upload_item):
+        """Try an upload up to three times with increasing delays"""
+        for attempt in range(3):
+            try:
+                # Recording names are unique, so only a retried or restored upload can already be in Drive
+                success = self.upload_to_drive(
+                    upload_item['filepath'],
+                    upload_item['username'],
+                    check_existing=attempt > 0 or upload_item.get('restored', False)
+                )
+                if success:
                     break
-                
-                upload_item = self.upload_queue.pop(0)
-            
-            # Try upload with retries
-            for attempt in range(3):
-                try:
-                    success = self.upload_to_drive(
-                        upload_item['filepath'],
-                        upload_item['username']
-                    )
-                    if success:
-                        break
-                    else:
-                        if attempt < 2:
-                            time.sleep(30 * (attempt + 1))  # Exponential backoff
-                        
-                except Exception as e:
-                    logger.error(f"❌ Upload attempt {attempt + 1} failed: {e}")
+                else:
                     if attempt < 2:
-                        time.sleep(30 * (attempt + 1))
+                        time.sleep(30 * (attempt + 1))  # Exponential backoff
+                    
+            except Exception as e:
+                logger.error("❌ Upload attempt %s failed: %s", attempt + 1, e)
+                if attempt < 2:
+                    time.sleep(30 * (attempt + 1))
+    
+    def _remove_local_file(self, filepath, label):
+        """Delete an uploaded recording; a failure here must not turn the upload into a retry"""
+        try:
+            Path(filepath).unlink(missing_ok=True)
+            logger.info("🗑️ Removed %s: %s", label, filepath)
+        except OSError as e:
+            logger.warning("⚠️ Could not remove %s %s: %s", label, filepath, e)
     
-    def upload_to_drive(self, filepath, username):
+    def upload_to_drive(self, filepath, username, check_existing=True):
         """Enhanced Drive upload with better error handling"""
         try:
-            if not drive_service:
+            service = get_drive_service()
+            if not service:
                 logger.warning("❌ Google Drive not connected")
                 return False
+            files = service.files()  # Build the resource once for every call below
             
-            if not os.path.exists(filepath):
-                logger.error(f"❌ File not found for upload: {filepath}")
+            local_size = file_size(filepath)
+            if local_size is None:
+                logger.error("❌ File not found for upload: %s", filepath)
                 return False
             
-            logger.info(f"☁️ Starting Drive upload for {username}...")
+            logger.info("☁️ Starting Drive upload for %s...", username)
             
             # Create folder structure: TikTok_Recordings/Username/YYYY-MM/
             current_date = datetime.now()
             year_month = current_date.strftime('%Y-%m')
             
             # Get or create folders
-            main_folder_id = self.get_or_create_folder(drive_service, "TikTok_Recordings")
+            main_folder_id = self.get_or_create_folder(service, "TikTok_Recordings")
             if not main_folder_id:
-                logger.error(f"❌ Cannot create main Drive folder")
+                logger.error("❌ Cannot create main Drive folder")
                 return False
             
-            user_folder_id = self.get_or_create_folder(drive_service, username, main_folder_id)
+            user_folder_id = self.get_or_create_folder(service, username, main_folder_id)
             if not user_folder_id:
-                logger.error(f"❌ Cannot create user Drive folder")
+                logger.error("❌ Cannot create user Drive folder")
                 return False
             
-            date_folder_id = self.get_or_create_folder(drive_service, year_month, user_folder_id)
+            date_folder_id = self.get_or_create_folder(service, year_month, user_folder_id)
             if not date_folder_id:
-                logger.error(f"❌ Cannot create date Drive folder")
+                logger.error("❌ Cannot create date Drive folder")
                 return False
             
             # Check if file already exists in Drive
             filename = os.path.basename(filepath)
-            existing_files = drive_service.files().list(
-                q=f"name='{filename}' and '{date_folder_id}' in parents and trashed=false",
-                fields="files(id, name)"
-            ).execute()
+            existing_files = files.list(
+                q=f"name='{drive_query_literal(filename)}' and '{date_folder_id}' in parents and trashed=false",
+                fields="files(id)",
+                pageSize=1
+            ).execute() if check_existing else {}
             
             if existing_files.get('files'):
-                logger.info(f"⚠️ File already exists in Drive: {filename}")
+                logger.info("⚠️ File already exists in Drive: %s", filename)
                 # Remove local file since it's already uploaded
-                try:
-                    os.remove(filepath)
-                    logger.info(f"🗑️ Removed duplicate local file: {filepath}")
-                except:
-                    pass
+                self._remove_local_file(filepath, "duplicate local file")
                 return True
             
-            # Upload file with resumable upload
+            # Small files go up in a single request; larger ones use a resumable session
             file_metadata = {
                 'name': filename,
                 'parents': [date_folder_id],
-                'description': f'TikTok livestream recording of @{username} from {current_date.strftime("%Y-%m-%d %H:%M:%S")}'
+                'description': DRIVE_DESCRIPTION_TEMPLATE.format(username=username, when=current_date)
             }
             
-            media = MediaFileUpload(
-                filepath, 
-                resumable=True,
-                chunksize=1024*1024*5  # 5MB chunks
-            )
-            
-            # Execute upload with timeout
-            request = drive_service.files().create(
-                body=file_metadata,
-                media_body=media,
-                fields='id,webViewLink,size'
-            )
-            
             file = None
             response = None
             
-            # Resumable upload loop
-            while response is None:
-                try:
-                    status, response = request.next_chunk()
-                    if status:
-                        logger.info(f"☁️ Upload progress for {username}: {int(status.progress() * 100)}%")
-                except Exception as chunk_error:
-                    logger.error(f"❌ Upload chunk error: {chunk_error}")
-                    raise chunk_error
+            resumable = local_size >= DRIVE_DIRECT_UPLOAD_MAX
+            with open(filepath, 'rb', buffering=UPLOAD_READ_BUFFER) as fh:
+                # Hash while uploading so the result can be verified without a second read
+                reader = HashingReader(fh)
+                media = MediaIoBaseUpload(
+                    reader,
+                    mimetype='video/mp4',
+                    resumable=resumable,
+                    chunksize=DRIVE_CHUNK_SIZE
+                )
+                
+                # Execute upload with timeout
+                request = files.create(
+                    body=file_metadata,
+                    media_body=media,
+                    fields='id,webViewLink,size,md5Checksum'
+                )
+                
+                if not resumable:
+                    response = request.execute(num_retries=UPLOAD_CHUNK_RETRIES)
+                
+                # Resumable upload loop; transient chunk failures resume from the last committed byte
+                chunks_sent = 0
+                while response is None:
+                    try:
+                        status, response = request.next_chunk(num_retries=UPLOAD_CHUNK_RETRIES)
+                        chunks_sent += 1
+                        if status and chunks_sent % UPLOAD_PROGRESS_EVERY == 0:
+                            logger.info("☁️ Upload progress for %s: %d%%", username, status.progress() * 100)
+                    except Exception as chunk_error:
+                        logger.error("❌ Upload chunk error: %s", chunk_error)
+                        raise chunk_error
             
             file = response
             file_id = file.get('id')
             web_link = file.get('webViewLink')
-            file_size = file.get('size', '0')
+            uploaded_size = file.get('size', '0')
             
-            logger.info(f"✅ Uploaded to Drive: {filename} (ID: {file_id}, Size: {int(file_size)/1024/1024:.1f}MB)")
+            remote_md5 = file.get('md5Checksum')
+            if reader.hashed_bytes == local_size and remote_md5 and remote_md5 != reader.md5.hexdigest():
+                # Corrupted in transit: drop the remote copy and keep the local file for a retry
+                logger.error("❌ Checksum mismatch for %s, discarding the Drive copy", filename)
+                files.delete(fileId=file_id).execute()
+                return False
             
-            # Remove local file after successful upload
-            try:
-                os.remove(filepath)
-                logger.info(f"🗑️ Removed local file: {filepath}")
-            except Exception as e:
-                logger.warning(f"⚠️ Could not remove local file: {e}")
+            logger.info("✅ Uploaded to Drive: %s (ID: %s, Size: %.1fMB)", filename, file_id, int(uploaded_size) / BYTES_PER_MB)
             
+            # Remove local file after successful upload (handle is already closed)
+            self._remove_local_file(filepath, "local file")
             return True
             
         except Exception as e:
-            logger.error(f"❌ Drive upload failed for {username}: {e}")
+            if isinstance(e, HttpError) and e.resp.status == 404:
+                # A cached folder was deleted in Drive; resolve the path again on retry
+                self.forget_drive_folders()
+            logger.error("❌ Drive upload failed for %s: %s", username, e)
             logger.error(traceback.format_exc())
             return False
     
     def get_or_create_folder(self, service, folder_name, parent_id=None):
+        """Return a Drive folder id from the cache, looking it up or creating it on a miss"""
+        cache_key = (parent_id, folder_name)
+        folder_id = self._folder_id_cache.get(cache_key)
+        if folder_id:
+            return folder_id
+        
+        # One miss at a time so parallel uploads cannot create the same folder twice
+        with self._folder_cache_lock:
+            folder_id = self._folder_id_cache.get(cache_key)
+            if not folder_id:
+                folder_id = self._find_or_create_folder(service, folder_name, parent_id)
+                if folder_id:
+                    self._folder_id_cache[cache_key] = folder_id
+            return folder_id
+    
+    def forget_drive_folders(self):
+        """Drop cached Drive folder ids (account changed or a folder was deleted)"""
+        with self._folder_cache_lock:
+            self._folder_id_cache.clear()
+            self.drive_folders_ensured.clear()
+    
+    def _find_or_create_folder(self, service, folder_name, parent_id=None):
         """Get or create a folder in Google Drive with retry logic"""
         try:
+            # Resource and query are the same for every attempt
+            files = service.files()
+            query = DRIVE_FOLDER_QUERY.format(name=drive_query_literal(folder_name))
+            if parent_id:
+                query += f" and '{parent_id}' in parents"
+            
             # Search for existing folder with retry
             for attempt in range(3):
                 try:
-                    query = f"name='{folder_name}' and mimeType='application/vnd.google-apps.folder' and trashed=false"
-                    if parent_id:
-                        query += f" and '{parent_id}' in parents"
-                    
-                    results = service.files().list(
+                    results = files.list(
                         q=query,
-                        fields="files(id, name)",
-                        pageSize=10
+                        fields="files(id)",
+                        pageSize=1
                     ).execute()
                     
                     folders = results.get('files', [])
@@ -829,100 +1656,216 @@ class StreamRecorder:
                     if parent_id:
                         folder_metadata['parents'] = [parent_id]
                     
-                    folder = service.files().create(
+                    folder = files.create(
                         body=folder_metadata,
                         fields='id'
                     ).execute()
                     
                     folder_id = folder.get('id')
-                    logger.info(f"📁 Created Drive folder: {folder_name} (ID: {folder_id})")
+                    logger.info("📁 Created Drive folder: %s (ID: %s)", folder_name, folder_id)
                     return folder_id
                     
                 except Exception as e:
-                    if attempt < 2:
-                        logger.warning(f"⚠️ Folder operation retry {attempt + 1}: {e}")
-                        time.sleep(5)
+                    if attempt < 2 and is_transient_drive_error(e):
+                        logger.warning("⚠️ Folder operation retry %s: %s", attempt + 1, e)
+                        backoff_sleep(attempt)
                         continue
                     else:
                         raise e
                 
         except Exception as e:
-            logger.error(f"❌ Error with Drive folder {folder_name}: {e}")
+            logger.error("❌ Error with Drive folder %s: %s", folder_name, e)
             return None
 
 # Initialize recorder
 recorder = StreamRecorder()
 
+def _read_credentials_store():
+    """Load the server-side credentials store (caller holds credentials_store_lock)"""
+    try:
+        with open(CREDENTIALS_STORE_FILE, 'rb') as f:
+            return orjson.loads(f.read())
+    except (FileNotFoundError, orjson.JSONDecodeError):
+        return {}
+
+def _write_credentials_store(store):
+    """Atomically replace the credentials store, readable only by this user"""
+    os.makedirs(os.path.dirname(os.path.abspath(CREDENTIALS_STORE_FILE)), mode=0o700, exist_ok=True)
+    tmp_path = CREDENTIALS_STORE_FILE + '.tmp'
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(orjson.dumps(store))
+    os.replace(tmp_path, CREDENTIALS_STORE_FILE)
+
+def store_session_credentials(creds):
+    """Keep OAuth credentials server-side; the session cookie only carries a random key"""
+    creds_data = {
+        'token': creds.token,
+        'refresh_token': creds.refresh_token,
+        'token_uri': creds.token_uri,
+        'client_id': creds.client_id,
+        'client_secret': creds.client_secret,
+        'scopes': creds.scopes,
+        'saved_at': time.time()
+    }
+    key = session.get('creds_key') or secrets.token_hex(16)
+    with credentials_store_lock:
+        store = _read_credentials_store()
+        # Drop entries whose session cookie has expired; they can never be looked up again
+        cutoff = time.time() - app.permanent_session_lifetime.total_seconds()
+        store = {k: v for k, v in store.items() if v.get('saved_at', 0) > cutoff}
+        store[key] = creds_data
+        _write_credentials_store(store)
+    session['creds_key'] = key
+    session.permanent = True
+
+def load_session_credentials():
+    """Credentials dict for this session, or None"""
+    key = session.get('creds_key')
+    if not key:
+        return None
+    with credentials_store_lock:
+        creds_data = _read_credentials_store().get(key)
+    if creds_data is not None:
+        creds_data.pop('saved_at', None)
+    return creds_data
+
+def clear_session_credentials():
+    """Forget this session's stored credentials"""
+    key = session.pop('creds_key', None)
+    if not key:
+        return
+    with credentials_store_lock:
+        store = _read_credentials_store()
+        if store.pop(key, None) is not None:
+            _write_credentials_store(store)
+
 def setup_drive_service():
     """Enhanced Drive service setup with better error handling"""
-    global drive_service, error_count, last_service_refresh
+    global drive_service, drive_creds, error_count, last_service_refresh
     
-    with service_lock:
-        try:
-            if 'credentials' not in session:
-                logger.warning("❌ No credentials in session")
-                return False
-            
-            creds_data = session['credentials']
-            creds = Credentials.from_authorized_user_info(creds_data)
+    try:
+        creds_data = load_session_credentials()
+        if not creds_data:
+            logger.warning("❌ No credentials in session")
+            return False
+        
+        creds = Credentials.from_authorized_user_info(creds_data)
+        
+        # Refresh if needed
+        if creds.expired and creds.refresh_token:
+            logger.info("🔄 Refreshing Google credentials...")
+            creds.refresh(Request())
             
-            # Refresh if needed
-            if creds.expired and creds.refresh_token:
-                logger.info("🔄 Refreshing Google credentials...")
-                creds.refresh(Request())
+            # Persist the refreshed token server-side (written atomically)
+            store_session_credentials(creds)
+        
+        # Build and test the service without holding any global lock
+        for attempt in range(3):
+            try:
+                service = build('drive', 'v3', credentials=creds)
                 
-                # Update session with new token
-                session['credentials'] = {
-                    'token': creds.token,
-                    'refresh_token': creds.refresh_token,
-                    'token_uri': creds.token_uri,
-                    'client_id': creds.client_id,
-                    'client_secret': creds.client_secret,
-                    'scopes': creds.scopes
-                }
-                session.permanent = True  # Make session permanent
-            
-            # Build service with retry logic
-            for attempt in range(3):
-                try:
-                    drive_service = build('drive', 'v3', credentials=creds)
-                    
-                    # Test the service
-                    test_query = drive_service.files().list(pageSize=1).execute()
-                    
-                    logger.info("✅ Google Drive service initialized and tested")
-                    last_service_refresh = datetime.now()
-                    error_count = 0
-                    return True
-                    
-                except Exception as e:
-                    if attempt < 2:
-                        logger.warning(f"⚠️ Drive service setup retry {attempt + 1}: {e}")
-                        time.sleep(5)
-                        continue
-                    else:
-                        raise e
-            
-        except Exception as e:
-            logger.error(f"❌ Error setting up Drive service: {e}")
-            drive_service = None
-            error_count += 1
-            
-            # Reset session if too many errors
-            if error_count > MAX_ERRORS_BEFORE_RESET:
-                logger.warning("🔄 Too many errors, clearing session...")
-                session.clear()
+                # Test the service
+                service.files().list(pageSize=1).execute()
+                
+                # Only the publish step is serialized
+                with service_lock:
+                    drive_service = service
+                with creds_lock:
+                    drive_creds = creds
+                drive_local.service, drive_local.creds = service, creds
+                
+                logger.info("✅ Google Drive service initialized and tested")
+                schedule_credentials_refresh()
+                last_service_refresh = datetime.now()
                 error_count = 0
-            
-        return False
+                return True
+                
+            except Exception as e:
+                if attempt < 2 and is_transient_drive_error(e):
+                    logger.warning("⚠️ Drive service setup retry %s: %s", attempt + 1, e)
+                    backoff_sleep(attempt)
+                    continue
+                else:
+                    raise e
+        
+    except Exception as e:
+        logger.error("❌ Error setting up Drive service: %s", e)
+        with service_lock:
+            drive_service = None
+        error_count += 1
+        
+        # Reset session if too many errors
+        if error_count > MAX_ERRORS_BEFORE_RESET:
+            logger.warning("🔄 Too many errors, clearing session...")
+            clear_session_credentials()
+            session.clear()
+            error_count = 0
+        
+    return False
+
+def get_drive_service():
+    """Return this thread's Drive service, rebuilt whenever the credentials change"""
+    creds = drive_creds
+    if creds is None:
+        return None
+    if getattr(drive_local, 'creds', None) is not creds:
+        # Each thread owns one keep-alive httplib2.Http, so chunks reuse its TLS connection
+        # and threads never share a socket
+        http = AuthorizedHttp(creds, http=httplib2.Http(timeout=DRIVE_HTTP_TIMEOUT))
+        drive_local.service = build('drive', 'v3', http=http, cache_discovery=False)
+        drive_local.creds = creds
+    return drive_local.service
 
-def refresh_drive_service():
-    """Periodically refresh Drive service to prevent timeouts"""
+def refresh_drive_credentials():
+    """Refresh the Drive access token in place so uploads never hit an expired token"""
     global last_service_refresh
     
-    if drive_service and datetime.now() - last_service_refresh > timedelta(hours=1):
-        logger.info("🔄 Refreshing Drive service...")
-        setup_drive_service()
+    with creds_lock:
+        creds = drive_creds
+        if not creds or not creds.refresh_token:
+            return False
+        try:
+            creds.refresh(Request())
+        except Exception as e:
+            logger.warning("⚠️ Background Drive token refresh failed: %s", e)
+            return False
+    
+    last_service_refresh = datetime.now()
+    logger.info("🔄 Drive access token refreshed")
+    return True
+
+def _credentials_refresh_tick():
+    """Timer callback: refresh the token and re-arm"""
+    global creds_refresh_timer
+    
+    creds_refresh_timer = None
+    refresh_drive_credentials()
+    schedule_credentials_refresh()
+
+def schedule_credentials_refresh():
+    """Arm the background token refresh timer if it is not already running"""
+    global creds_refresh_timer
+    
+    with creds_lock:
+        if creds_refresh_timer is not None or drive_creds is None:
+            return
+        timer = threading.Timer(TOKEN_REFRESH_INTERVAL, _credentials_refresh_tick)
+        timer.daemon = True
+        timer.start()
+        creds_refresh_timer = timer
+
+def iter_completed_checks(check_futures, timeout=LIVE_CHECK_TIMEOUT):
+    """Yield (username, future) in completion order; checks still pending after the timeout come last"""
+    pending = dict(check_futures)
+    try:
+        for future in as_completed(check_futures, timeout=timeout):
+            yield pending.pop(future), future
+    except FuturesTimeoutError:
+        for future, username in pending.items():
+            logger.warning("⏱️ Live check for %s timed out after %ss", username, timeout)
+            future.cancel()
+            yield username, future
 
 def monitoring_loop():
     """Enhanced monitoring loop with better error recovery and 24/7 reliability"""
@@ -930,118 +1873,231 @@ def monitoring_loop():
     
     logger.info("🔄 Enhanced monitoring loop started")
     consecutive_errors = 0
+    last_gc = time.monotonic()
     
     while monitoring_active:
         cycle_start = time.time()
+        cycle_mono = time.monotonic()
+        cycle_now = datetime.now()  # One "as of" timestamp for every update in this cycle
+        cycle_now_formatted = cycle_now.strftime('%H:%M:%S')
         
         try:
-            # Refresh Drive service periodically
-            refresh_drive_service()
             
             usernames = recorder.load_usernames()
             if not usernames:
                 logger.info("📭 No usernames to monitor")
-                time.sleep(CHECK_INTERVAL)
+                monitoring_stop.wait(CHECK_INTERVAL)
                 continue
             
-            logger.info(f"🔍 Checking {len(usernames)} users...")
             
-            # Process users with better error isolation
-            for i, username in enumerate(usernames):
+            # Snapshot recording keys once; only users in it need the locked checks below
+            active = frozenset(recording_processes)
+            
+            # An active ffmpeg pipe is the authoritative liveness signal
+            updated_users = []
+            pending_checks = []
+            for username in usernames:
+                if user_state.get(username) == STATE_RECORDING and recorder.is_process_healthy(username):
+                    last_check_times[username] = cycle_now
+                    last_check_formatted[username] = cycle_now_formatted
+                    live_status[username] = True
+                    rec_info = recording_processes.get(username)
+                    if rec_info:
+                        duration = cycle_now - rec_info['start_time']
+                        logger.info("📹 Still recording %s (%.0fs)", username, duration.total_seconds())
+                    updated_users.append(username)
+                    last_seen_live[username] = cycle_mono
+                elif cycle_mono >= next_check.get(username, 0):
+                    pending_checks.append(username)
+            still_recording = frozenset(updated_users)
+            
+            logger.info("🔍 Checking %s of %s users...", len(pending_checks), len(usernames))
+            
+            # Fan liveness checks out across the persistent check pool
+            check_futures = {
+                get_pool("LiveCheck", LIVE_CHECK_WORKERS).submit(recorder.check_live_status, username): username
+                for username in pending_checks
+            }
+            
+            # Handle each result as soon as it lands, with per-user error isolation
+            for username, future in iter_completed_checks(check_futures):
                 if not monitoring_active:
-                    break
+                    future.cancel()
+                    continue
                 
                 try:
-                    # Update last check time
-                    last_check_times[username] = datetime.now()
-                    
-                    # Check live status
-                    is_live, stream_info = recorder.check_live_status(username)
+                    # Collect live status
+                    is_live, stream_info = future.result(timeout=0)
+                    last_check_times[username] = cycle_now
+                    last_check_formatted[username] = cycle_now_formatted
                     live_status[username] = is_live
                     
+                    # Back off users who stay offline; recheck live and recently-live users soon
+                    if is_live:
+                        consecutive_offline[username] = 0
+                        last_seen_live[username] = cycle_mono
+                        next_check[username] = cycle_mono + LIVE_RECHECK_INTERVAL
+                    else:
+                        misses = consecutive_offline.get(username, 0)
+                        consecutive_offline[username] = misses + 1
+                        if cycle_mono - last_seen_live.get(username, float('-inf')) < RECENT_LIVE_WINDOW:
+                            next_check[username] = cycle_mono + LIVE_RECHECK_INTERVAL
+                        else:
+                            next_check[username] = cycle_mono + min(MAX_OFFLINE_BACKOFF, CHECK_INTERVAL * 2 ** min(misses, 8))
+                    
                     if is_live:
-                        logger.info(f"🔴 {username} is LIVE!")
+                        logger.info("🔴 %s is LIVE!", username)
+                        user_state[username] = STATE_LIVE
                         
                         # Check if already recording
-                        with active_recordings_lock:
-                            already_recording = username in recording_processes
-                            if already_recording:
-                                # Verify process is still alive
-                                process = recording_processes[username]['process']
-                                if process.poll() is not None:
-                                    logger.warning(f"⚠️ Recording process died for {username}, restarting...")
-                                    recorder._cleanup_recording(username)
-                                    already_recording = False
+                        already_recording = False
+                        if username in active:
+                            # An exited ffmpeg still counts until the RecordingSupervisor has
+                            # finalized and uploaded it; the next check restarts the recording
+                            with active_recordings_lock:
+                                already_recording = username in recording_processes
                         
                         if not already_recording:
-                            logger.info(f"🎬 Starting new recording for {username}")
+                            logger.info("🎬 Starting new recording for %s", username)
                             success = recorder.start_recording(username, stream_info)
                             if success:
-                                logger.info(f"✅ Recording started for {username}")
+                                logger.info("✅ Recording started for %s", username)
                                 consecutive_errors = 0  # Reset error count on success
                             else:
-                                logger.error(f"❌ Failed to start recording for {username}")
+                                logger.error("❌ Failed to start recording for %s", username)
                                 consecutive_errors += 1
                         else:
                             # Log active recording status
                             rec_info = recording_processes.get(username)
                             if rec_info:
-                                duration = datetime.now() - rec_info['start_time']
-                                logger.info(f"📹 Still recording {username} ({duration.total_seconds():.0f}s)")
+                                duration = cycle_now - rec_info['start_time']
+                                logger.info("📹 Still recording %s (%.0fs)", username, duration.total_seconds())
                     else:
                         # User is not live
-                        with active_recordings_lock:
-                            if username in recording_processes:
-                                logger.info(f"🛑 {username} went offline, stopping recording")
-                                recorder.stop_recording(username)
+                        user_state[username] = STATE_OFFLINE
+                        if username in active:
+                            with active_recordings_lock:
+                                if username in recording_processes:
+                                    logger.info("🛑 %s went offline, stopping recording", username)
+                                    recorder.stop_recording(username)
                     
-                    # Delay between user checks to prevent rate limiting
-                    time.sleep(8)
+                    updated_users.append(username)
                     
                 except Exception as e:
-                    logger.error(f"❌ Error processing {username}: {e}")
+                    logger.error("❌ Error processing %s: %s", username, e)
                     live_status[username] = False
+                    user_state[username] = STATE_ERROR_BACKOFF
+                    next_check[username] = cycle_mono + CHECK_INTERVAL
                     consecutive_errors += 1
                     
                     # If too many consecutive errors, try to recover
                     if consecutive_errors > 5:
                         logger.warning("🔄 Too many errors, attempting recovery...")
-                        time.sleep(30)
+                        if monitoring_stop.wait(30):
+                            break
                         
                         # Try to refresh services
                         if drive_service:
-                            setup_drive_service()
+                            refresh_drive_credentials()
                         
                         consecutive_errors = 0
             
-            # Calculate sleep time to maintain consistent intervals
+            # Push the whole cycle's changes to dashboard clients at once
+            publish_user_updates(updated_users)
+            refresh_api_status_cache()
+            
+            # Sleep until the earliest per-user check is due, at most one full interval
             cycle_duration = time.time() - cycle_start
-            sleep_time = max(CHECK_INTERVAL - cycle_duration, 10)
+            next_due = min(
+                (next_check.get(u, 0) for u in usernames if u not in still_recording),
+                default=cycle_mono + CHECK_INTERVAL
+            )
+            sleep_time = max(min(CHECK_INTERVAL - cycle_duration, next_due - time.monotonic()), MIN_CYCLE_SLEEP)
             
-            logger.info(f"⏱️ Cycle completed in {cycle_duration:.1f}s, waiting {sleep_time:.1f}s...")
+            logger.info("⏱️ Cycle completed in %.1fs, waiting %.1fs...", cycle_duration, sleep_time)
             
-            # Sleep with monitoring check
-            for i in range(int(sleep_time)):
-                if not monitoring_active:
-                    break
-                time.sleep(1)
+            # Single wait, cut short as soon as monitoring is stopped
+            if monitoring_stop.wait(sleep_time):
+                break
             
             # Garbage collection to prevent memory leaks
-            if datetime.now().minute % 10 == 0:  # Every 10 minutes
-                gc.collect()
+            if time.monotonic() - last_gc > GC_INTERVAL:  # Exactly once per interval
+                collect_garbage()
+                last_gc = time.monotonic()
                 
         except Exception as e:
-            logger.error(f"❌ Critical error in monitoring loop: {e}")
+            logger.error("❌ Critical error in monitoring loop: %s", e)
             logger.error(traceback.format_exc())
             consecutive_errors += 1
             
             # Recovery sleep - longer for critical errors
             recovery_sleep = min(60 * consecutive_errors, 300)  # Max 5 minutes
-            logger.info(f"🔄 Recovery sleep: {recovery_sleep}s")
-            time.sleep(recovery_sleep)
+            logger.info("🔄 Recovery sleep: %ds", recovery_sleep)
+            monitoring_stop.wait(recovery_sleep)
     
     logger.info("🛑 Monitoring loop stopped")
 
+def snapshot_recordings():
+    """Lock-free shallow copy of recording_processes (a dict copy is atomic under the GIL)"""
+    return dict(recording_processes)
+
+def build_api_status_body():
+    """Serialize the current /api/status payload"""
+    usernames = recorder.load_usernames()
+    recordings = snapshot_recordings()
+    timestamp = datetime.now()
+    
+    users = [{
+        'username': username,
+        'is_live': live_status.get(username, False),
+        'is_recording': username in recordings,
+        'last_check': last_check_times.get(username)
+    } for username in usernames]
+    
+    for user_info in users:
+        rec_info = recordings.get(user_info['username'])
+        if not rec_info:
+            continue
+        
+        try:
+            duration = timestamp - rec_info['start_time']
+            user_info.update({
+                'recording_duration_seconds': int(duration.total_seconds()),
+                'recording_file': rec_info['filename'],
+                'file_size_bytes': rec_info['bytes_written']  # From ffmpeg progress; no stat needed
+            })
+        except Exception as e:
+            logger.error("❌ Error preparing user status for %s: %s", user_info['username'], e)
+    
+    return orjson.dumps({
+        'monitoring_active': monitoring_active,
+        'drive_connected': drive_service is not None,
+        'total_users': len(usernames),
+        'live_users': sum(1 for user_info in users if user_info['is_live']),
+        'recording_users': len(recordings),
+        'last_update': timestamp,
+        'uptime_seconds': int((timestamp - session_start_time).total_seconds()),
+        'error_count': error_count,
+        'users': users
+    })
+
+def refresh_api_status_cache():
+    """Rebuild the /api/status body and publish it to the cache"""
+    body = build_api_status_body()
+    with api_status_cache_lock:
+        api_status_cache['expires'] = time.monotonic() + API_STATUS_CACHE_TTL
+        api_status_cache['body'] = body
+    return body
+
+def invalidate_api_status_cache():
+    """Force the next /api/status request to rebuild its response"""
+    with api_status_cache_lock:
+        api_status_cache['expires'] = 0
+
+def orjsonify(data, status=200):
+    """JSON response serialized with orjson (handles datetime natively)"""
+    return Response(orjson.dumps(data), status=status, mimetype='application/json')
+
 @app.route('/')
 def index():
     """Main page - redirect to status"""
@@ -1052,59 +2108,96 @@ def status():
     """Enhanced status dashboard"""
     try:
         usernames = recorder.load_usernames()
+        recordings = snapshot_recordings()
         
-        # Prepare user data with better error handling
-        user_data = []
-        for username in usernames:
+        # One directory listing instead of an exists() call per user
+        try:
+            with os.scandir(RECORDINGS_DIR) as entries:
+                user_dirs = {entry.name for entry in entries if entry.is_dir()}
+        except FileNotFoundError:
+            user_dirs = set()
+        
+        # Base fields are read straight from state kept by the monitoring loop
+        user_data = [{
+            'username': username,
+            'is_live': live_status.get(username, False),
+            'is_recording': username in recordings,
+            'last_check_formatted': last_check_formatted.get(username),
+            'folder_exists': username in user_dirs
+        } for username in usernames]
+        
+        # Add recording details only for users with an active recording
+        now = datetime.now()
+        for user_info in user_data:
+            rec_info = recordings.get(user_info['username'])
+            if not rec_info:
+                continue
+            
             try:
-                user_info = {
-                    'username': username,
-                    'is_live': live_status.get(username, False),
-                    'is_recording': username in recording_processes,
-                    'last_check': last_check_times.get(username),
-                    'folder_exists': os.path.exists(os.path.join(RECORDINGS_DIR, username))
-                }
-                
-                # Add recording details if active
-                if username in recording_processes:
-                    rec_info = recording_processes[username]
-                    duration = datetime.now() - rec_info['start_time']
-                    filepath = rec_info['filepath']
-                    
-                    user_info.update({
-                        'recording_duration': str(duration).split('.')[0],
-                        'recording_file': rec_info['filename'],
-                        'file_size': os.path.getsize(filepath) if os.path.exists(filepath) else 0,
-                        'recording_start_formatted': rec_info['start_time'].strftime('%H:%M:%S')
-                    })
-                
-                # Format last check time
-                if user_info['last_check']:
-                    user_info['last_check_formatted'] = user_info['last_check'].strftime('%H:%M:%S')
-                
-                user_data.append(user_info)
-                
-            except Exception as e:
-                logger.error(f"❌ Error preparing user data for {username}: {e}")
-                # Add minimal user info
-                user_data.append({
-                    'username': username,
-                    'is_live': False,
-                    'is_recording': False,
-                    'error': True
+                duration = now - rec_info['start_time']
+                user_info.update({
+                    'recording_duration': str(duration).split('.')[0],
+                    'recording_file': rec_info['filename'],
+                    'file_size': rec_info['bytes_written'],
+                    'recording_start_formatted': rec_info['start_time_formatted']
                 })
+            except Exception as e:
+                logger.error("❌ Error preparing recording data for %s: %s", user_info['username'], e)
+                user_info.update({'is_recording': False, 'error': True})
         
         return render_template('status.html',
                              users=user_data,
                              monitoring_active=monitoring_active,
                              drive_connected=drive_service is not None,
-                             total_recordings=len(recording_processes),
-                             uptime=str(datetime.now() - session_start_time).split('.')[0])
+                             total_recordings=len(recordings),
+                             uptime=str(now - session_start_time).split('.')[0])
                              
     except Exception as e:
-        logger.error(f"❌ Error in status route: {e}")
+        logger.error("❌ Error in status route: %s", e)
         return f"Error loading status: {e}", 500
 
+@app.route('/events')
+def events():
+    """Server-Sent Events stream of per-user status changes"""
+    if status_broadcaster.closed or not status_broadcaster.clients.acquire(blocking=False):
+        # Keep threads free for other routes; the dashboard falls back to polling
+        return Response(status=503, headers={'Retry-After': str(SSE_MAX_LIFETIME)})
+    
+    last_event_id = request.headers.get('Last-Event-ID', '')
+    response = Response(
+        status_broadcaster.stream(int(last_event_id) if last_event_id.isdigit() else None),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    # Runs when the server closes the response, even if the stream never started
+    response.call_on_close(status_broadcaster.clients.release)
+    return response
+
+def initial_user_check(username):
+    """Create folders and run a first live check for a newly added user"""
+    try:
+        recorder.create_user_folder(username)
+        is_live, stream_info = recorder.check_live_status(username)
+        checked_at = time.monotonic()
+        live_status[username] = is_live
+        last_check_times[username] = datetime.now()
+        last_check_formatted[username] = last_check_times[username].strftime('%H:%M:%S')
+        
+        # Hand the result to the monitor's schedule so the next sweep doesn't probe again
+        if is_live:
+            last_seen_live[username] = checked_at
+            next_check[username] = checked_at + LIVE_RECHECK_INTERVAL
+            user_state[username] = STATE_LIVE
+            if monitoring_active:
+                logger.info("🎬 Newly added %s is LIVE, starting recording", username)
+                recorder.start_recording(username, stream_info)
+        else:
+            next_check[username] = checked_at + CHECK_INTERVAL
+            user_state[username] = STATE_OFFLINE
+        publish_user_updates([username])
+    except Exception as e:
+        logger.error("❌ Initial check failed for %s: %s", username, e)
+
 @app.route('/add_user', methods=['POST'])
 def add_user():
     """Add a new user to monitoring"""
@@ -1113,14 +2206,17 @@ def add_user():
         
         if username:
             success = recorder.add_username(username)
+            invalidate_api_status_cache()
             if success:
+                # Folder setup and the first live check happen off the request path
+                get_pool("LiveCheck", LIVE_CHECK_WORKERS).submit(initial_user_check, username.replace('@', '').strip())
                 flash(f"✅ Added @{username} to monitoring", 'success')
             else:
                 flash(f"⚠️ @{username} is already being monitored", 'warning')
         else:
             flash("❌ Please enter a valid username", 'error')
     except Exception as e:
-        logger.error(f"❌ Error adding user: {e}")
+        logger.error("❌ Error adding user: %s", e)
         flash("❌ Error adding user", 'error')
     
     return redirect(url_for('status'))
@@ -1133,32 +2229,39 @@ def remove_user():
         
         if username:
             success = recorder.remove_username(username)
+            invalidate_api_status_cache()
             if success:
                 flash(f"🗑️ Removed @{username} from monitoring", 'success')
             else:
                 flash(f"❌ @{username} not found", 'error')
     except Exception as e:
-        logger.error(f"❌ Error removing user: {e}")
+        logger.error("❌ Error removing user: %s", e)
         flash("❌ Error removing user", 'error')
     
     return redirect(url_for('status'))
 
-@app.route('/auth/google')
-def auth_google():
-    """Enhanced Google OAuth flow"""
-    try:
-        # Load credentials from environment or file
+def get_oauth_client_config():
+    """Load the OAuth client config once from environment or local file"""
+    global oauth_client_config
+    
+    if oauth_client_config is None:
         creds_json = os.environ.get('GOOGLE_CREDENTIALS_JSON')
         if creds_json:
             # Use environment variable (for production)
-            import tempfile
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as f:
-                f.write(creds_json)
-                credentials_file = f.name
+            oauth_client_config = json.loads(creds_json)
         elif os.path.exists('credentials.json'):
             # Use local file (for development)
-            credentials_file = 'credentials.json'
-        else:
+            with open('credentials.json', 'r', encoding='utf-8') as f:
+                oauth_client_config = json.load(f)
+    
+    return oauth_client_config
+
+@app.route('/auth/google')
+def auth_google():
+    """Enhanced Google OAuth flow"""
+    try:
+        client_config = get_oauth_client_config()
+        if not client_config:
             flash("❌ Google OAuth credentials not configured", 'error')
             return redirect(url_for('status'))
         
@@ -1172,8 +2275,8 @@ def auth_google():
         redirect_uri = f"{scheme}://{host}/oauth2callback"
         
         # Create OAuth flow
-        flow = Flow.from_client_secrets_file(
-            credentials_file,
+        flow = Flow.from_client_config(
+            client_config,
             scopes=SCOPES,
             redirect_uri=redirect_uri
         )
@@ -1186,14 +2289,13 @@ def auth_google():
         
         session['state'] = state
         session['redirect_uri'] = redirect_uri
-        session['flow_credentials_file'] = credentials_file
         session.permanent = True  # Make session permanent
         
-        logger.info(f"🔗 Starting OAuth flow with redirect: {redirect_uri}")
+        logger.info("🔗 Starting OAuth flow with redirect: %s", redirect_uri)
         return redirect(authorization_url)
         
     except Exception as e:
-        logger.error(f"❌ OAuth error: {e}")
+        logger.error("❌ OAuth error: %s", e)
         flash(f"❌ OAuth setup error: {str(e)}", 'error')
         return redirect(url_for('status'))
 
@@ -1203,15 +2305,15 @@ def oauth2callback():
     try:
         state = session.get('state')
         redirect_uri = session.get('redirect_uri')
-        credentials_file = session.get('flow_credentials_file')
+        client_config = get_oauth_client_config()
         
-        if not state or not redirect_uri or not credentials_file:
+        if not state or not redirect_uri or not client_config:
             flash("❌ OAuth state error - please try again", 'error')
             return redirect(url_for('status'))
         
         # Recreate flow with same parameters
-        flow = Flow.from_client_secrets_file(
-            credentials_file,
+        flow = Flow.from_client_config(
+            client_config,
             scopes=SCOPES,
             state=state,
             redirect_uri=redirect_uri
@@ -1228,21 +2330,12 @@ def oauth2callback():
         
         credentials = flow.credentials
         
-        # Store credentials in session with permanent flag
-        session['credentials'] = {
-            'token': credentials.token,
-            'refresh_token': credentials.refresh_token,
-            'token_uri': credentials.token_uri,
-            'client_id': credentials.client_id,
-            'client_secret': credentials.client_secret,
-            'scopes': credentials.scopes
-        }
-        session.permanent = True
+        # Store credentials server-side; the session keeps only their key
+        store_session_credentials(credentials)
         
         # Clean up session
         session.pop('state', None)
         session.pop('redirect_uri', None)
-        session.pop('flow_credentials_file', None)
         
         # Setup Drive service
         setup_success = setup_drive_service()
@@ -1253,6 +2346,9 @@ def oauth2callback():
             for username in usernames:
                 recorder.create_user_folder(username)
             
+            # Uploads interrupted by a restart can go out now that Drive is connected
+            threading.Thread(target=recorder.restore_pending_uploads, daemon=True, name="UploadRestore").start()
+            
             flash("✅ Google Drive authorized successfully!", 'success')
             logger.info("✅ Google Drive authorization completed")
             
@@ -1265,7 +2361,7 @@ def oauth2callback():
             flash("⚠️ Drive authorization completed but service setup failed", 'warning')
         
     except Exception as e:
-        logger.error(f"❌ OAuth callback error: {e}")
+        logger.error("❌ OAuth callback error: %s", e)
         logger.error(traceback.format_exc())
         flash(f"❌ Authorization failed: {str(e)}", 'error')
     
@@ -1275,7 +2371,8 @@ def oauth2callback():
 def start_monitoring():
     """Start monitoring endpoint"""
     result = start_monitoring_internal()
-    return jsonify(result)
+    invalidate_api_status_cache()
+    return orjsonify(result)
 
 def start_monitoring_internal():
     """Enhanced internal function to start monitoring"""
@@ -1293,6 +2390,10 @@ def start_monitoring_internal():
             return {"status": "error", "message": "No usernames to monitor"}
         
         monitoring_active = True
+        monitoring_stop.clear()
+        next_check.clear()
+        consecutive_offline.clear()
+        last_seen_live.clear()
         monitoring_thread = threading.Thread(
             target=monitoring_loop, 
             daemon=True,
@@ -1300,11 +2401,11 @@ def start_monitoring_internal():
         )
         monitoring_thread.start()
         
-        logger.info(f"🚀 Monitoring started for {len(usernames)} users")
+        logger.info("🚀 Monitoring started for %s users", len(usernames))
         return {"status": "success", "message": f"Monitoring started for {len(usernames)} users"}
         
     except Exception as e:
-        logger.error(f"❌ Error starting monitoring: {e}")
+        logger.error("❌ Error starting monitoring: %s", e)
         return {"status": "error", "message": f"Failed to start monitoring: {str(e)}"}
 
 @app.route('/stop_monitoring', methods=['POST'])
@@ -1314,9 +2415,10 @@ def stop_monitoring():
     
     try:
         if not monitoring_active:
-            return jsonify({"status": "warning", "message": "Monitoring not active"})
+            return orjsonify({"status": "warning", "message": "Monitoring not active"})
         
         monitoring_active = False
+        monitoring_stop.set()
         
         # Stop all active recordings gracefully
         with active_recordings_lock:
@@ -1325,23 +2427,24 @@ def stop_monitoring():
         for username in active_users:
             recorder.stop_recording(username)
         
+        invalidate_api_status_cache()
         logger.info("🛑 Monitoring stopped")
-        return jsonify({"status": "success", "message": "Monitoring stopped"})
+        return orjsonify({"status": "success", "message": "Monitoring stopped"})
         
     except Exception as e:
-        logger.error(f"❌ Error stopping monitoring: {e}")
-        return jsonify({"status": "error", "message": f"Failed to stop: {str(e)}"})
+        logger.error("❌ Error stopping monitoring: %s", e)
+        return orjsonify({"status": "error", "message": f"Failed to stop: {str(e)}"})
 
 @app.route('/test_user/<username>')
 def test_user(username):
     """Test endpoint to check a specific user's live status"""
     try:
-        is_live, stream_info = recorder.check_live_status(username)
+        is_live, stream_info = recorder.check_live_status_cached(username)
         
         result = {
             'username': username,
             'is_live': is_live,
-            'timestamp': datetime.now().isoformat(),
+            'timestamp': datetime.now(),
             'stream_info_available': stream_info is not None
         }
         
@@ -1349,74 +2452,40 @@ def test_user(username):
             result['stream_title'] = stream_info.get('title', 'Unknown')
             result['stream_duration'] = stream_info.get('duration', 'Unknown')
         
-        logger.info(f"🧪 Test result for {username}: {'LIVE' if is_live else 'OFFLINE'}")
-        return jsonify(result)
+        logger.info("🧪 Test result for %s: %s", username, 'LIVE' if is_live else 'OFFLINE')
+        return orjsonify(result)
         
     except Exception as e:
-        logger.error(f"❌ Test failed for {username}: {e}")
-        return jsonify({
+        logger.error("❌ Test failed for %s: %s", username, e)
+        return orjsonify({
             'username': username,
             'error': str(e),
-            'timestamp': datetime.now().isoformat()
-        }), 500
+            'timestamp': datetime.now()
+        }, 500)
 
 @app.route('/api/status')
 def api_status():
-    """Enhanced API endpoint for status data"""
+    """Enhanced API endpoint for status data, served from the pre-built body when fresh"""
     try:
-        usernames = recorder.load_usernames()
-        
-        status_data = {
-            'monitoring_active': monitoring_active,
-            'drive_connected': drive_service is not None,
-            'total_users': len(usernames),
-            'live_users': sum(1 for user in usernames if live_status.get(user, False)),
-            'recording_users': len(recording_processes),
-            'last_update': datetime.now().isoformat(),
-            'uptime_seconds': int((datetime.now() - session_start_time).total_seconds()),
-            'error_count': error_count,
-            'users': []
-        }
-        
-        for username in usernames:
-            try:
-                user_info = {
-                    'username': username,
-                    'is_live': live_status.get(username, False),
-                    'is_recording': username in recording_processes,
-                    'last_check': last_check_times.get(username, datetime.now()).isoformat() if username in last_check_times else None
-                }
-                
-                if username in recording_processes:
-                    rec_info = recording_processes[username]
-                    duration = datetime.now() - rec_info['start_time']
-                    filepath = rec_info['filepath']
-                    
-                    user_info.update({
-                        'recording_duration_seconds': int(duration.total_seconds()),
-                        'recording_file': rec_info['filename'],
-                        'file_size_bytes': os.path.getsize(filepath) if os.path.exists(filepath) else 0
-                    })
-                
-                status_data['users'].append(user_info)
-                
-            except Exception as e:
-                logger.error(f"❌ Error preparing user status for {username}: {e}")
+        with api_status_cache_lock:
+            if time.monotonic() < api_status_cache['expires']:
+                return Response(api_status_cache['body'], mimetype='application/json')
         
-        return jsonify(status_data)
+        return Response(refresh_api_status_cache(), mimetype='application/json')
         
     except Exception as e:
-        logger.error(f"❌ Error in API status: {e}")
-        return jsonify({'error': str(e)}), 500
+        logger.error("❌ Error in API status: %s", e)
+        return orjsonify({'error': str(e)}, 500)
 
 @app.route('/revoke')
 def revoke():
     """Enhanced revoke Google Drive authorization"""
-    global drive_service, monitoring_active
+    global drive_service, drive_creds, monitoring_active
     
     try:
         # Stop monitoring first
         monitoring_active = False
+        monitoring_stop.set()
         
         # Stop all recordings
         with active_recordings_lock:
@@ -1426,16 +2495,19 @@ def revoke():
             recorder.stop_recording(username)
         
         # Clear session and service
+        clear_session_credentials()
         with service_lock:
-            if 'credentials' in session:
-                del session['credentials']
             drive_service = None
+        with creds_lock:
+            drive_creds = None
+        # Folder ids belong to the revoked account
+        recorder.forget_drive_folders()
         
         flash("🔓 Google Drive authorization revoked", 'info')
         logger.info("🔓 Drive authorization revoked")
         
     except Exception as e:
-        logger.error(f"❌ Error revoking authorization: {e}")
+        logger.error("❌ Error revoking authorization: %s", e)
         flash("❌ Error revoking authorization", 'error')
     
     return redirect(url_for('status'))
@@ -1447,6 +2519,8 @@ def force_check(username):
         is_live, stream_info = recorder.check_live_status(username)
         live_status[username] = is_live
         last_check_times[username] = datetime.now()
+        last_check_formatted[username] = last_check_times[username].strftime('%H:%M:%S')
+        publish_user_updates([username])
         
         if is_live:
             flash(f"🔴 {username} is LIVE!", 'success')
@@ -1456,7 +2530,7 @@ def force_check(username):
         return redirect(url_for('status'))
         
     except Exception as e:
-        logger.error(f"❌ Error force checking {username}: {e}")
+        logger.error("❌ Error force checking %s: %s", username, e)
         flash(f"❌ Error checking {username}: {str(e)}", 'error')
         return redirect(url_for('status'))
 
@@ -1464,13 +2538,14 @@ def force_check(username):
 def health_check():
     """Health check endpoint for monitoring"""
     try:
+        now = datetime.now()
         health_data = {
             'status': 'healthy',
             'monitoring_active': monitoring_active,
             'drive_connected': drive_service is not None,
             'active_recordings': len(recording_processes),
-            'uptime_seconds': int((datetime.now() - session_start_time).total_seconds()),
-            'timestamp': datetime.now().isoformat()
+            'uptime_seconds': int((now - session_start_time).total_seconds()),
+            'timestamp': now
         }
         
         # Check if monitoring thread is alive
@@ -1478,35 +2553,65 @@ def health_check():
             health_data['status'] = 'degraded'
             health_data['warning'] = 'Monitoring thread not active'
         
-        return jsonify(health_data)
+        return orjsonify(health_data)
         
     except Exception as e:
-        return jsonify({
+        return orjsonify({
             'status': 'error',
             'error': str(e),
-            'timestamp': datetime.now().isoformat()
-        }), 500
+            'timestamp': datetime.now()
+        }, 500)
 
 # Enhanced signal handling
-def signal_handler(sig, frame):
-    """Enhanced shutdown signal handler"""
+def graceful_shutdown():
+    """Stop monitoring and recordings, wait for their files to be finalized, then drain the worker pools"""
     global monitoring_active
     
     logger.info("🛑 Shutdown signal received - performing graceful shutdown...")
     monitoring_active = False
+    monitoring_stop.set()
+    shutdown_event.set()
+    cleanup_wake.set()
+    status_broadcaster.close()
     
-    # Stop all recordings gracefully
+    # Stop all recordings gracefully, in parallel so shutdown takes one stop timeout at most
     with active_recordings_lock:
-        active_users = list(recording_processes.keys())
+        stopping = list(recording_processes.items())
     
-    for username in active_users:
-        logger.info(f"🛑 Stopping recording for {username}...")
-        recorder.stop_recording(username)
+    if stopping:
+        logger.info("🛑 Stopping recordings for %s...", ', '.join(username for username, _ in stopping))
+        with ThreadPoolExecutor(max_workers=len(stopping), thread_name_prefix="StopRecording") as pool:
+            list(pool.map(recorder.stop_recording, [username for username, _ in stopping]))
+        
+        # The supervisor renames each .part file and queues its upload as the exit is seen
+        deadline = time.monotonic() + RECORDING_FINISH_TIMEOUT
+        for username, rec_info in stopping:
+            if not rec_info['finished'].wait(max(0, deadline - time.monotonic())):
+                logger.warning("⚠️ Recording for %s was not finalized before shutdown", username)
     
-    # Wait for processes to stop
-    time.sleep(5)
+    shutdown_pools()
     
     logger.info("✅ Graceful shutdown completed")
+
+shutdown_thread = None
+shutdown_thread_lock = Lock()
+
+def begin_shutdown():
+    """Start graceful_shutdown once, in the background, so it overlaps request draining"""
+    global shutdown_thread
+    with shutdown_thread_lock:
+        if shutdown_thread is None:
+            shutdown_thread = threading.Thread(target=graceful_shutdown, name="GracefulShutdown")
+            shutdown_thread.start()
+        return shutdown_thread
+
+def wait_for_shutdown():
+    """Run graceful_shutdown if it has not started yet and wait for it to finish"""
+    begin_shutdown().join(SHUTDOWN_GRACE_PERIOD)
+
+def signal_handler(sig, frame):
+    """Enhanced shutdown signal handler"""
+    wait_for_shutdown()
     sys.exit(0)
 
 # Register signal handlers
@@ -1518,61 +2623,54 @@ def periodic_cleanup():
     """Periodic cleanup to prevent resource leaks"""
     while True:
         try:
-            time.sleep(600)  # Every 10 minutes
+            cleanup_wake.wait(600)  # Every 10 minutes, or when woken
+            cleanup_wake.clear()
+            if shutdown_event.is_set():
+                return
             
-            # Clean up dead processes
-            with active_recordings_lock:
-                dead_users = []
-                for username, rec_info in recording_processes.items():
-                    if rec_info['process'].poll() is not None:
-                        dead_users.append(username)
-                
-                for username in dead_users:
-                    logger.info(f"🧹 Cleaning up dead process for {username}")
-                    recorder._cleanup_recording(username)
+            # Exited ffmpeg processes are reaped by the RecordingSupervisor as their pidfd fires;
+            # .part files orphaned by a killed worker's ffmpeg are picked up here
+            recorder.recover_partial_recordings()
             
-            # Garbage collection
-            gc.collect()
+            # Garbage collection, skipped when the old generation is unchanged
+            collect_garbage()
             
-            # Log memory usage
-            process = psutil.Process()
-            memory_mb = process.memory_info().rss / 1024 / 1024
-            logger.info(f"💾 Memory usage: {memory_mb:.1f}MB")
+            # Log interpreter memory counters; cheap trend signal without /proc parsing
+            blocks = sys.getallocatedblocks()
+            collected = '/'.join(str(stats['collected']) for stats in gc.get_stats())
+            logger.info("💾 Memory: %s allocated blocks, gc collected %s (gen0/1/2)", blocks, collected)
             
         except Exception as e:
-            logger.error(f"❌ Cleanup error: {e}")
+            logger.error("❌ Cleanup error: %s", e)
 
-if __name__ == '__main__':
-    logger.info("🚀 TikTok Livestream Recorder - ENHANCED PRODUCTION VERSION")
-    logger.info("=" * 70)
-    
-    # Create initial folder structures
+def start_worker_tasks():
+    """Startup work for the serving process: user folders, interrupted recordings, periodic cleanup"""
     usernames = recorder.load_usernames()
-    logger.info(f"📋 Loaded {len(usernames)} usernames: {usernames}")
+    logger.info("📋 Loaded %s usernames: %s", len(usernames), usernames)
     
     for username in usernames:
         recorder.create_user_folder(username)
     
-    # Start periodic cleanup thread
-    cleanup_thread = threading.Thread(target=periodic_cleanup, daemon=True, name="PeriodicCleanup")
-    cleanup_thread.start()
+    # Recordings interrupted by a crash or kill were left as .part files
+    recorder.recover_partial_recordings()
+    
+    threading.Thread(target=periodic_cleanup, daemon=True, name="PeriodicCleanup").start()
+
+if __name__ == '__main__':
+    logger.info("🚀 TikTok Livestream Recorder - ENHANCED PRODUCTION VERSION")
+    logger.info("=" * 70)
     
     # Get port from environment (Render sets this)
     port = int(os.environ.get('PORT', 5000))
     
-    logger.info(f"🚀 Starting server on port {port}")
+    logger.info("🚀 Starting server on port %s", port)
     logger.info("📊 Dashboard will be available at the provided URL")
     logger.info("🔗 Authorize Google Drive to enable automatic monitoring")
     
-    # Run Flask app with production settings
+    # Hand this process over to gunicorn so both entry points run with gunicorn.conf.py
+    config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gunicorn.conf.py')
     try:
-        app.run(
-            host='0.0.0.0', 
-            port=port, 
-            debug=False, 
-            threaded=True,
-            use_reloader=False  # Disable reloader in production
-        )
-    except Exception as e:
-        logger.error(f"❌ Server startup error: {e}")
-        sys.exit(1)
\ No newline at end of file
+        os.execv(sys.executable, [sys.executable, '-u', '-m', 'gunicorn', '--config', config_path, 'main:app'])
+    except OSError as e:
+        logger.error("❌ Server startup error: %s", e)
+        sys.exit(1)
@@ -28,6 +28,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Longer than graceful_timeout in gunicorn.conf.py, so recordings are finalized before a kill
+MAIN_STOP_TIMEOUT = 60
+
 class ProductionLauncher:
     """Production launcher with ultimate reliability features"""
     
@@ -350,7 +353,7 @@ class ProductionLauncher:
             if self.main_process:
                 try:
                     self.main_process.terminate()
-                    self.main_process.wait(timeout=30)
+                    self.main_process.wait(timeout=MAIN_STOP_TIMEOUT)
                 except subprocess.TimeoutExpired:
                     self.main_process.kill()
                     self.main_process.wait()
@@ -447,7 +450,7 @@ class ProductionLauncher:
                 
                 # Wait for graceful shutdown
                 try:
-                    self.main_process.wait(timeout=30)
+                    self.main_process.wait(timeout=MAIN_STOP_TIMEOUT)
                     logger.info("✅ Main application stopped gracefully")
                 except subprocess.TimeoutExpired:
                     logger.warning("🔪 Force killing main application...")
@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def main_module(tmp_path, monkeypatch):
+    """Import main with its working files (log, recordings, journal) inside tmp_path"""
+    monkeypatch.chdir(tmp_path)
+    import main
+    monkeypatch.setattr(main, 'RECORDINGS_DIR', str(tmp_path / 'recordings'))
+    monkeypatch.setattr(main, 'UPLOAD_JOURNAL_FILE', str(tmp_path / 'pending_uploads.jsonl'))
+    monkeypatch.setattr(main, 'drive_service', None)
+    return main
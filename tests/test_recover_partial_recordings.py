@@ -0,0 +1,45 @@
+import os
+import time
+
+import orjson
+
+
+def write_part(path, size, age):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b'\0' * size)
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_stale_part_files_are_finalized_or_removed(main_module, tmp_path):
+    user_dir = tmp_path / 'recordings' / 'alice'
+    kept = write_part(user_dir / 'alice_1.mp4.part', main_module.MIN_RECORDING_BYTES + 1, 3600)
+    small = write_part(user_dir / 'alice_2.mp4.part', 10, 3600)
+    fresh = write_part(user_dir / 'alice_3.mp4.part', main_module.MIN_RECORDING_BYTES + 1, 0)
+    
+    assert main_module.recorder.recover_partial_recordings() == (1, 1)
+    
+    final_path = user_dir / 'alice_1.mp4'
+    assert final_path.exists() and not kept.exists()
+    assert not small.exists()
+    assert fresh.exists()  # May still be written by an ffmpeg that outlived its worker
+    
+    journal = [orjson.loads(line) for line in (tmp_path / 'pending_uploads.jsonl').read_bytes().splitlines()]
+    assert [(entry['filepath'], entry['username']) for entry in journal] == [
+        (os.path.join(main_module.RECORDINGS_DIR, 'alice', 'alice_1.mp4'), 'alice')
+    ]
+
+
+def test_active_recording_is_left_alone(main_module, tmp_path, monkeypatch):
+    part = write_part(tmp_path / 'recordings' / 'bob' / 'bob_1.mp4.part', main_module.MIN_RECORDING_BYTES + 1, 3600)
+    monkeypatch.setattr(main_module, 'recording_processes', {'bob': {'filepath': str(part)}})
+    
+    assert main_module.recorder.recover_partial_recordings() == (0, 0)
+    assert part.exists()
+
+
+def test_missing_recordings_dir(main_module, tmp_path, monkeypatch):
+    monkeypatch.setattr(main_module, 'RECORDINGS_DIR', str(tmp_path / 'absent'))
+    
+    assert main_module.recorder.recover_partial_recordings() == (0, 0)